@@ -4,9 +4,13 @@
 Created on Wed Sep 22 15:33:14 2021
 @author: lidia
 """
+from functools import cached_property
 import numpy as np
+import scipy.linalg
+import scipy.sparse
+import scipy.sparse.linalg
 from sklearn.model_selection import train_test_split
-from sklearn.utils import resample, shuffle
+from sklearn.utils import shuffle
 from sklearn import linear_model
 import matplotlib.pyplot as plt
 from matplotlib import cm
@@ -21,8 +25,10 @@ class FrankeFunction():
         axis_n (int): number of datapoint per axis (total n = axis_n^2)
         noise_var (float or int): variance of the noise
         plot (bool): Plot franke function?
+        realizations (int): if given, z is a (n, realizations) matrix with 
+            one independent noise realization of the same points per column
     '''
-    def __init__(self, axis_n = 20, noise_var = 0, plot = False):
+    def __init__(self, axis_n = 20, noise_var = 0, plot = False, realizations = None):
         # Generate x and y vectors divided equally in a 2d grid
         x = np.linspace(0, 1, axis_n) 
         y = np.linspace(0, 1, axis_n)
@@ -33,7 +39,13 @@ class FrankeFunction():
         
         # Generate z, add noise
         z = self.franke_function(self.x, self.y)
-        noise = np.random.normal(0,noise_var,(self.x.shape))
+        if realizations is None:
+            noise = np.random.normal(0,noise_var,(self.x.shape))
+        else:
+            z = z[:, None]
+            # drawn realization by realization, so column 0 is the noise of 
+            # realizations=None with the same seed
+            noise = np.random.normal(0,noise_var,(realizations, len(self.x))).T
         self.z = z + noise
             
         # In order to plot the function, use x_2d and y_2d as input instead
@@ -80,25 +92,76 @@ class LinearRegression():
     Args:
         x (1d array): x-coordinates 
         y (1d array): y-coordinates
-        z_data (1d array): z vector created by FrankeFunction()
+        z_data (1d or 2d array): z vector created by FrankeFunction(), or an 
+            (n, m) matrix of m targets on the same points (e.g. m noise 
+            realizations). OLS and Ridge solve all targets with one 
+            factorization, beta is then (p, m), and the scores (MSE, R2, 
+            bias, var) are column-wise. bootstrap, kfold and the path 
+            methods take 1d z.
         degree (int): degree of polynomial to use in regression
         split (bool): split the data in train and test
         test_size (float): amount of data used in test (between 0 and 1)
-        model (str): model to use in regression ('OLS', 'Ridge', 'Lasso')
+        model (str): model to use in regression ('OLS', 'Ridge', 'Lasso'). If 
+            None, only the design matrix is made (and split), nothing is fitted
         seed: seed to split the data in order to get reproducable results
         plot (bool): Plot the mode output? (currently not working...)
+        solver (str): least squares solver for OLS and Ridge: 'auto', 
+            'cholesky', 'qr', 'lstsq' or 'svd'. 'auto' picks the cheapest 
+            stable one from the conditioning. The one used is stored in 
+            self.solver_used. For tall design matrices there are also the 
+            randomized 'sketch' (sketch-and-solve) and 'blendenpik' (LSQR 
+            with a sketched preconditioner), see _solve().
+        tol (float): tolerance of the randomized solvers. 'sketch': the 
+            residual is within a factor about (1 + tol) of the least squares 
+            residual (default 0.1). 'blendenpik': relative tolerance of LSQR 
+            (default 1e-10).
+        basis (str): polynomial basis of the design matrix: 'monomial' 
+            (x^i y^j), or the tensor products 'legendre' (P_i(x) P_j(y)) or 
+            'chebyshev' (T_i(x) T_j(y)) with x and y mapped from the range of 
+            the data to [-1, 1]. The orthogonal bases give nearly orthogonal 
+            columns at high degree; to_monomial() converts their beta back.
+        grid (bool): x and y are the axes of a regular grid and z_data the 
+            2d array of values on np.meshgrid(x, y) (e.g. a terrain raster). 
+            No design matrix is made; OLS/Ridge are fitted on all the data 
+            with fit_grid() and z_model is a 2d array like z_data. split, plot 
+            and 'Lasso' are not supported in this mode (ValueError).
+        domain (tuple): ((x_min, x_max), (y_min, y_max)) mapped to [-1, 1] by 
+            the orthogonal bases, defaults to the range of x and y. With x, y 
+            and z_data None and model=None the model is unfitted, only the 
+            basis is set up (for partial_fit() and fit_stream()).
     '''
     def __init__(self, x, y, z_data, degree = 3, split = False, test_size = 0.3,
-                 model = 'OLS', seed = 42, lamb=0,plot = False):
+                 model = 'OLS', seed = 42, lamb=0,plot = False, solver = 'auto',
+                 basis = 'monomial', grid = False, tol = None, domain = None):
         
+        if x is None and (model is not None or split or grid):
+            raise ValueError("Without data, model must be None and split and grid False")
         self.degree = degree
         self.x = x
         self.y = y
         self.z_data = z_data
-        self.X = self.design_matrix(x, y)
+        self.basis = basis
+        if domain is None and x is not None:
+            domain = [np.min(x), np.max(x)], [np.min(y), np.max(y)]
+        elif domain is None and basis != 'monomial':
+            raise ValueError("basis '{}' needs the domain of an unfitted model".format(basis))
+        self.domain = None if domain is None else [list(axis) for axis in domain]
+        self.X = None if grid or x is None else self.design_matrix(x, y)
         self.lamb = lamb
+        self.solver = solver
+        self.solver_used = None
+        self.tol = tol
+        self.seed = seed
+        self.P = None   # inverse Gram matrix of partial_fit()
+        self.G_seen, self.b_seen = None, None   # X^T X and X^T z of partial_fit() until P exists
         
-        if split: 
+        if grid:
+            if split or plot:
+                raise ValueError("grid=True does not support split or plot")
+            if model is not None:
+                self.beta = self.fit_grid(x, y, z_data, model=model, lamb=lamb)
+                self.z_model = self.predict_grid(x, y, self.beta)
+        elif split: 
             
             self.X_train, self.X_test, self.z_train, self.z_test = \
             self.split_and_scale(self.X, self.z_data, test_size) 
@@ -110,9 +173,7 @@ class LinearRegression():
                 if plot:
                     x_plot, y_plot = np.linspace(0, 1, 20), np.linspace(0, 1, 20)
                     x_2d_plot, y_2d_plot = np.meshgrid(x_plot,y_plot)
-                    x_plot, y_plot = x_2d_plot.ravel(), y_2d_plot.ravel()
-                    X_plot = self.design_matrix(x_plot, y_plot)
-                    z_plot = self.predict(X_plot, self.beta)
+                    z_plot = self.predict_grid(x_plot, y_plot, self.beta)
                     self.plot(x_2d_plot, y_2d_plot, z_plot)
             elif model == 'Ridge':
                 self.beta = self.Ridge_regression(self.X_train, self.z_train)
@@ -121,9 +182,7 @@ class LinearRegression():
                 if plot:
                     x_plot, y_plot = np.linspace(0, 1, 20), np.linspace(0, 1, 20)
                     x_2d_plot, y_2d_plot = np.meshgrid(x_plot,y_plot)
-                    x_plot, y_plot = x_2d_plot.ravel(), y_2d_plot.ravel()
-                    X_plot = self.design_matrix(x_plot, y_plot)
-                    z_plot = self.predict(X_plot, self.beta)
+                    z_plot = self.predict_grid(x_plot, y_plot, self.beta)
                     self.plot(x_2d_plot, y_2d_plot, z_plot)
             elif model == 'Lasso':
                 self.beta, self.intercept = self.Lasso_regression(self.X_train, self.z_train)
@@ -132,9 +191,7 @@ class LinearRegression():
                 if plot:
                     x_plot, y_plot = np.linspace(0, 1, 20), np.linspace(0, 1, 20)
                     x_2d_plot, y_2d_plot = np.meshgrid(x_plot,y_plot)
-                    x_plot, y_plot = x_2d_plot.ravel(), y_2d_plot.ravel()
-                    X_plot = self.design_matrix(x_plot, y_plot)
-                    z_plot = self.predict(X_plot, self.beta)
+                    z_plot = self.predict_grid(x_plot, y_plot, self.beta)
                     self.plot(x_2d_plot, y_2d_plot, z_plot)   
         else:
             if model == 'OLS':
@@ -157,8 +214,8 @@ class LinearRegression():
         for i in range(len(X_train.T)):
             X_train[:,i] = X_train[:,i] - np.mean(X_train[:,i])
             X_test[:,i]  = X_test[:,i] - np.mean(X_test[:,i])
-        z_train = z_train - np.mean(z_train)
-        z_test = z_test - np.mean(z_test)
+        z_train = z_train - np.mean(z_train, axis=0)
+        z_test = z_test - np.mean(z_test, axis=0)
 
         return X_train, X_test, z_train, z_test
     
@@ -172,59 +229,1103 @@ class LinearRegression():
         Return: 
             beta (1d array): regression parameters
         '''
-        beta = np.linalg.pinv(X.T @ X) @ X.T @ z
+        beta = self._solve(X, z, 0)
         return beta
     
-    def Ridge_regression(self, X, z):
+    def Ridge_regression(self, X, z, lamb=None):
         '''
         Get parameters for Ridge regression
         Args: 
             X (2d array): design matrix
             z (1d array): z vector (input to model)
+            lamb (float): lambda value, defaults to self.lamb
         Return: 
             beta (1d array): regression parameters
         '''
-        A = self.lamb*np.eye(len(X.T))
-        # A[0,0] = 0
-        beta = np.linalg.pinv(X.T @ X + A) @  (X.T @ z)
+        if lamb is None: lamb = self.lamb
+        beta = self._solve(X, z, lamb)
+        return beta
+    
+    def _solve(self, X, z, lamb=0):
+        '''
+        Least squares solver behind OLS() and Ridge_regression(), minimizes 
+        |z - X beta|^2 + lamb |beta|^2 with the backend in self.solver:
+            'cholesky': Cholesky of X^T X + lamb I, cheapest, squares the 
+                condition number
+            'qr': QR of X (stacked on sqrt(lamb) I for Ridge)
+            'lstsq': np.linalg.lstsq on the same stacked system
+            'svd': SVD of X^T X + lamb I, i.e. np.linalg.pinv of it (the 
+                original solver)
+            'sketch': QR of a CountSketch S X of X, approximate
+            'blendenpik': LSQR on X preconditioned with the R of a 
+                CountSketch of X, accurate to self.tol
+        'auto' forms X^T X + lamb I once and tries Cholesky. With the LAPACK 
+        condition estimate of the factor it keeps Cholesky if the condition 
+        number is below 1e10, uses QR of X if it is below 1e14 (cond(X) below 
+        1e7), and else goes straight to the SVD of the Gram matrix it already 
+        has. Any backend that fails falls back to the next one 
+        (cholesky -> qr -> svd). All-zero columns (the intercept after 
+        centering) are left out and get beta = 0, as with pinv. The backend 
+        that ran is stored in self.solver_used.
+        '''
+        live = np.any(X != 0, axis=0)
+        X_live = X[:, live]
+        
+        if self.solver == 'auto':
+            G, c = self._normal_equations(X_live, z, lamb)
+            try:
+                beta_live, cond = self._cholesky_gram(G, c)
+            except np.linalg.LinAlgError:
+                cond = np.inf
+            solver = 'cholesky' if cond < 1e10 else 'qr' if cond < 1e14 else 'svd'
+            if solver == 'qr':
+                try:
+                    beta_live, _ = self._solve_qr(X_live, z, lamb)
+                except np.linalg.LinAlgError:
+                    solver = 'svd'
+            if solver == 'svd':
+                beta_live, _ = self._svd_gram(G, c)
+        else:
+            chain = [self.solver] + [s for s in ['qr', 'svd'] if s != self.solver]
+            for solver in chain:
+                try:
+                    beta_live, _ = getattr(self, '_solve_'+solver)(X_live, z, lamb)
+                except np.linalg.LinAlgError:
+                    continue
+                if np.all(np.isfinite(beta_live)):
+                    break
+        self.solver_used = solver
+        
+        beta = np.zeros((X.shape[1],) + np.shape(z)[1:])
+        beta[live] = beta_live
         return beta
+    
+    def fit_grid(self, x_axis, y_axis, z_grid, model='OLS', lamb=None):
+        '''
+        OLS or Ridge on data on the grid np.meshgrid(x_axis, y_axis), without 
+        making the design matrix. On a grid the tensor-product basis factors 
+        as V_x (x) V_y, so with the thin SVDs V_x = U_x S_x W_x^T and 
+        V_y = U_y S_y W_y^T the whole problem projects onto the small 
+        (degree+1)^2 system
+            G = U_y^T Z U_x  ~  M C N^T,  M = S_y W_y^T, N = S_x W_x^T
+        in the coefficient matrix C[y_exp, x_exp]. The projection costs 
+        O(n * degree) for n grid points. The total-degree model is the 
+        columns of kron(M, N) with x_exp + y_exp <= degree; that system has 
+        the same X^T X and X^T z as the full design matrix, so it is solved 
+        with _solve() and gives the same beta as OLS()/Ridge_regression() on 
+        design_matrix() of the grid (uncentered, as with split=False).
+        Args:
+            x_axis (1d array): x-coordinates of the grid columns
+            y_axis (1d array): y-coordinates of the grid rows
+            z_grid (2d array): shape (len(y_axis), len(x_axis)), z_grid[i, j]
+                is the value at (x_axis[j], y_axis[i])
+            model (str): 'OLS' or 'Ridge'
+            lamb (float): lambda value for Ridge, defaults to self.lamb
+        Return: 
+            beta (1d array): regression parameters, in design_matrix() order
+        '''
+        if model == 'OLS':
+            lamb = 0
+        elif model == 'Ridge':
+            if lamb is None: lamb = self.lamb
+        else:
+            raise ValueError("fit_grid supports 'OLS' and 'Ridge', not '{}'".format(model))
+        
+        U_x, s_x, Wt_x = np.linalg.svd(self.vander(x_axis, 0), full_matrices=False)
+        U_y, s_y, Wt_y = np.linalg.svd(self.vander(y_axis, 1), full_matrices=False)
+        G = U_y.T @ np.asarray(z_grid, dtype=float) @ U_x
+        A = np.kron(s_y[:, None]*Wt_y, s_x[:, None]*Wt_x)
+        
+        x_exps, y_exps = self.exponents()
+        return self._solve(A[:, y_exps*(self.degree +1) + x_exps], G.ravel(), lamb)
+    
+    def _normal_equations(self, X, z, lamb):
+        '''
+        Gram matrix X^T X + lamb I and right hand side X^T z.
+        '''
+        return X.T @ X + lamb*np.eye(X.shape[1]), X.T @ z
+    
+    def _solve_cholesky(self, X, z, lamb):
+        '''
+        Normal equations with Cholesky, see _cholesky_gram().
+        '''
+        return self._cholesky_gram(*self._normal_equations(X, z, lamb))
+    
+    def _cholesky_gram(self, G, c, L=None):
+        '''
+        Solve G beta = c with the Cholesky factor L of G (computed if not 
+        given). The condition number of G is the LAPACK (pocon) estimate in 
+        the 1-norm.
+        '''
+        if L is None: L = np.linalg.cholesky(G)
+        return scipy.linalg.cho_solve((L, True), c), self._cond_cholesky(G, L)
+    
+    def _cond_cholesky(self, G, L):
+        '''
+        LAPACK (pocon) estimate of the 1-norm condition number of G from its 
+        lower Cholesky factor L.
+        '''
+        rcond, _ = scipy.linalg.lapack.dpocon(L, np.abs(G).sum(axis=0).max(), uplo='L')
+        return 1/rcond if rcond > 0 else np.inf
+    
+    def _solve_qr(self, X, z, lamb):
+        '''
+        QR of X, stacked on sqrt(lamb) I for Ridge. The condition number of 
+        X is the LAPACK (trcon) estimate for R.
+        '''
+        X, z = self._stack_ridge(X, z, lamb)
+        Q, R = np.linalg.qr(X)
+        if np.abs(np.diagonal(R)).min() == 0:
+            raise np.linalg.LinAlgError('Singular R in QR solver')
+        return scipy.linalg.solve_triangular(R, Q.T @ z), self._cond_triangular(R)
+    
+    def _cond_triangular(self, R):
+        '''
+        LAPACK (trcon) estimate of the 1-norm condition number of the upper 
+        triangular R.
+        '''
+        rcond, _ = scipy.linalg.lapack.dtrcon(R)
+        return 1/rcond if rcond > 0 else np.inf
+    
+    def _solve_lstsq(self, X, z, lamb):
+        '''
+        np.linalg.lstsq on X stacked on sqrt(lamb) I.
+        '''
+        X, z = self._stack_ridge(X, z, lamb)
+        beta, _, _, s = np.linalg.lstsq(X, z, rcond=None)
+        return beta, s.max()/s.min() if s.min() > 0 else np.inf
+    
+    def _solve_svd(self, X, z, lamb):
+        '''
+        SVD of X^T X + lamb I, see _svd_gram().
+        '''
+        return self._svd_gram(*self._normal_equations(X, z, lamb))
+    
+    def _svd_gram(self, G, c):
+        '''
+        pinv(G) c from the SVD of the p x p matrix G, with the cutoff of 
+        np.linalg.pinv.
+        '''
+        U, w, Vt = np.linalg.svd(G)
+        keep = w > 1e-15 * w.max()
+        d = np.where(keep, 1/np.where(keep, w, 1), 0)
+        d = d.reshape(d.shape + (1,)*(np.ndim(c)-1))
+        cond = w.max()/w.min() if w.min() > 0 else np.inf
+        return Vt.T @ (d * (U.T @ c)), cond
+    
+    def _count_sketch(self, n, n_rows):
+        '''
+        CountSketch matrix of shape (n_rows, n): every column has one random 
+        +-1 in a random row, so S @ X costs one pass over X.
+        '''
+        rng = np.random.default_rng(self.seed)
+        return scipy.sparse.csr_matrix(
+            (rng.choice([-1., 1.], n), (rng.integers(0, n_rows, n), np.arange(n))), 
+            shape=(n_rows, n))
+    
+    def _solve_sketch(self, X, z, lamb):
+        '''
+        Sketch-and-solve: least squares on S X, S z with a CountSketch S of 
+        about p/tol rows (the Ridge rows are added after sketching). The 
+        condition number of X is estimated from the R of S X.
+        '''
+        tol = 0.1 if self.tol is None else self.tol
+        n, p = X.shape
+        n_rows = int(min(n, max(4*p, np.ceil(p/tol))))
+        S = self._count_sketch(n, n_rows)
+        return self._solve_qr(S @ X, S @ z, lamb)
+    
+    def _solve_blendenpik(self, X, z, lamb):
+        '''
+        Blendenpik-style solver: R from the QR of a CountSketch of 4p rows 
+        of X (stacked for Ridge) is used as a right preconditioner, and LSQR 
+        solves min |X R^-1 y - z| to relative tolerance self.tol; beta = R^-1 y. 
+        X R^-1 is well conditioned, so LSQR needs few iterations. The 
+        condition number of X is estimated from R.
+        '''
+        tol = 1e-10 if self.tol is None else self.tol
+        X, z = self._stack_ridge(X, z, lamb)
+        n, p = X.shape
+        S = self._count_sketch(n, min(n, 4*p))
+        R = np.linalg.qr(S @ X, mode='r')
+        if np.abs(np.diagonal(R)).min() == 0:
+            raise np.linalg.LinAlgError('Singular R in blendenpik solver')
+        A = scipy.sparse.linalg.LinearOperator(
+            (n, p), dtype=float,
+            matvec=lambda y: X @ scipy.linalg.solve_triangular(R, y),
+            rmatvec=lambda r: scipy.linalg.solve_triangular(R, X.T @ r, trans='T'))
+        z_cols = z.reshape(n, -1)
+        Y = np.column_stack([scipy.sparse.linalg.lsqr(A, z_col, atol=tol, btol=tol, 
+                                                      iter_lim=10*p)[0] 
+                             for z_col in z_cols.T])
+        beta = scipy.linalg.solve_triangular(R, Y).reshape((p,) + np.shape(z)[1:])
+        return beta, self._cond_triangular(R)
+    
+    def _stack_ridge(self, X, z, lamb):
+        '''
+        Write Ridge as least squares: X on top of sqrt(lamb) I, z on top of 
+        zeros.
+        '''
+        if lamb == 0:
+            return X, z
+        p = X.shape[1]
+        X = np.vstack([X, np.sqrt(lamb)*np.eye(p)])
+        z = np.concatenate([z, np.zeros((p,) + np.shape(z)[1:])])
+        return X, z
+    
+    def _qr_add_column(self, Q, R, k, v, tol):
+        '''
+        Append v as column k of the thin QR factorization Q[:, :k] R[:k, :k] 
+        (in place), with Gram-Schmidt run twice for stability. If the 
+        remainder of v has norm at most tol, v is (numerically) in the span 
+        of the first k columns and is not added.
+        Returns: 
+            added (bool): True if v is now column k
+        '''
+        v = np.array(v, dtype=float)
+        R[:k, k] = 0
+        for _ in range(2):
+            c = Q[:, :k].T @ v
+            v -= Q[:, :k] @ c
+            R[:k, k] += c
+        if np.linalg.norm(v) <= tol:
+            return False
+        R[k, k] = np.linalg.norm(v)
+        Q[:, k] = v/R[k, k]
+        return True
+
+    def Ridge_path(self, X_train, X_test, z_train, z_test, lambs):
+        '''
+        Ridge regression for a whole vector of lambdas. The train design 
+        matrix is factorized once (thin SVD, X = U S V^T), after that every 
+        lambda only rescales the singular values, so each extra lambda costs 
+        O(p*n) instead of a new pseudo-inverse.
+        Args: 
+            X_train (2d array): train design matrix
+            X_test (2d array): test design matrix
+            z_train (1d array): train z vector
+            z_test (1d array): test z vector
+            lambs (1d array): lambda values
+        Return: 
+            betas (2d array): regression parameters, one column per lambda
+            z_model (2d array): test predictions, one column per lambda
+            z_model_train (2d array): train predictions, one column per lambda
+            error (1d array): test MSE for each lambda
+            error_train (1d array): train MSE for each lambda
+        '''
+        lambs = np.atleast_1d(lambs).astype(float)
+        U, s, Vt = np.linalg.svd(X_train, full_matrices=False)
+        Uz = U.T @ z_train
+        d = self._ridge_filter(s, lambs)
+        
+        betas = Vt.T @ (d * Uz[:, None])
+        z_model = X_test @ betas
+        z_model_train = U @ (s[:, None] * d * Uz[:, None])
+        error = np.mean((z_test[:, None] - z_model)**2, axis=0)
+        error_train = np.mean((z_train[:, None] - z_model_train)**2, axis=0)
+        return betas, z_model, z_model_train, error, error_train
+    
+    def loocv_gcv(self, X, z, lambs):
+        '''
+        Exact leave-one-out cross-validation and generalized cross-validation
+        scores of Ridge regression (OLS for lambda = 0) for a whole grid of 
+        lambdas, from one SVD of the design matrix. With X = U S V^T the hat 
+        matrix is U diag(s^2/(s^2 + lambda)) U^T, so its diagonal h, the 
+        residuals r and its trace are cheap for every lambda, and
+            LOOCV = mean((r/(1 - h))^2),  GCV = mean(r^2)/(1 - trace/n)^2
+        Args: 
+            X (2d array): design matrix
+            z (1d array): z vector
+            lambs (1d array): lambda values
+        Return: 
+            loocv (1d array): LOOCV score (MSE) for each lambda
+            gcv (1d array): GCV score for each lambda
+        '''
+        lambs = np.atleast_1d(lambs).astype(float)
+        n = len(z)
+        U, s, _ = np.linalg.svd(X, full_matrices=False)
+        Uz = U.T @ z
+        U_sq = U**2
+        
+        loocv = np.empty(len(lambs))
+        gcv = np.empty(len(lambs))
+        batch = max(1, 2**22 // n)
+        for start in range(0, len(lambs), batch):
+            f = s[:, None] * self._ridge_filter(s, lambs[start:start+batch])
+            res = z[:, None] - U @ (f * Uz[:, None])
+            h = U_sq @ f
+            loocv[start:start+batch] = np.mean((res / (1 - h))**2, axis=0)
+            gcv[start:start+batch] = np.mean(res**2, axis=0) \
+                                     / (1 - np.sum(f, axis=0)/n)**2
+        return loocv, gcv
+    
+    def _ridge_filter(self, s, lambs):
+        '''
+        Ridge filter factors s/(s^2 + lambda) for the singular values s of a 
+        design matrix, one column per lambda. Directions with s^2 + lambda 
+        below the same relative cutoff as np.linalg.pinv(X.T @ X + A) are set 
+        to zero, so lambda=0 gives the same solution as self.OLS.
+        '''
+        denom = s[:, None]**2 + lambs[None, :]
+        keep = denom > 1e-15 * denom.max(axis=0)
+        return np.where(keep, s[:, None] / np.where(keep, denom, 1), 0)
 
-    def Lasso_regression(self, X, z):
+    def Lasso_regression(self, X, z, lamb=None):
         '''
         Get parameters for Lasso regression
         Args: 
             X (2d array): design matrix
             z (1d array): z vector (input to model)
-            lambd (scalar): lambda value for sparsity constraint parameter
+            lamb (scalar): lambda value for sparsity constraint parameter, 
+                defaults to self.lamb
         Return: 
             beta (1d array): regression parameters
+            intercept (float)
         '''
-
-        model = linear_model.Lasso(alpha=self.lamb,max_iter=10000)
+        if lamb is None: lamb = self.lamb
+        model = linear_model.Lasso(alpha=lamb,max_iter=10000)
         reg = model.fit(X,z)
         beta = reg.coef_
         intercept = reg.intercept_
         return beta.T, intercept
     
+    def Lasso_path(self, X, z, lambs=None, n_lambs=100, eps=1e-4, tol=1e-5, 
+                   max_iter=10000):
+        '''
+        Lasso regression for a whole grid of lambdas, with the same objective 
+        (and intercept) as Lasso_regression:
+            1/(2n) |z - X beta - intercept|^2 + lambda |beta|_1
+        Coordinate descent runs on the precomputed Gram matrix, going from 
+        large to small lambda and starting each lambda from the solution of 
+        the previous one. Before each lambda the strong rule discards the 
+        columns that are very likely zero; they are checked against the KKT 
+        conditions afterwards and added back if needed.
+        Args: 
+            X (2d array): design matrix
+            z (1d array): z vector
+            lambs (1d array): lambda values, defaults to n_lambs values 
+                log-spaced from the smallest lambda giving beta = 0 down to 
+                eps times that
+            n_lambs (int): number of lambdas when lambs is not given
+            eps (float): ratio between the smallest and largest lambda
+            tol (float): stop when no coefficient update changes the model 
+                by more than tol times the standard deviation of z
+            max_iter (int): maximum number of coordinate descent sweeps per 
+                lambda
+        Return: 
+            lambs (1d array): lambda values, in decreasing order
+            betas (2d array): regression parameters, one column per lambda
+            intercepts (1d array): intercept for each lambda
+        '''
+        n, p = X.shape
+        X_mean = np.mean(X, axis=0)
+        z_mean = np.mean(z)
+        X_c = X - X_mean
+        G = X_c.T @ X_c / n
+        c = X_c.T @ (z - z_mean) / n
+        
+        lamb_max = np.max(np.abs(c))
+        if lambs is None:
+            lambs = lamb_max * np.logspace(0, np.log10(eps), n_lambs)
+        else:
+            lambs = np.sort(np.atleast_1d(lambs).astype(float))[::-1]
+        tol = tol * np.std(z)
         
-    def design_matrix(self, x, y):
+        diag = np.diagonal(G)
+        usable = diag > 0
+        beta = np.zeros(p)
+        q = np.zeros(p)     # q = G @ beta, updated with each coordinate
+        betas = np.empty((p, len(lambs)))
+        lamb_prev = lamb_max
+        for k, lamb in enumerate(lambs):
+            # strong rule: keep columns whose correlation with the residual
+            # is close to lambda, and the ones that are already non-zero
+            strong = usable & ((np.abs(c - q) >= 2*lamb - lamb_prev) | (beta != 0))
+            while True:
+                self._lasso_cd(G, c, beta, q, lamb, np.flatnonzero(strong), 
+                               tol, max_iter)
+                violations = usable & ~strong & (np.abs(c - q) > lamb)
+                if not violations.any(): break
+                strong |= violations
+            betas[:, k] = beta
+            lamb_prev = lamb
+        
+        intercepts = z_mean - X_mean @ betas
+        return lambs, betas, intercepts
+    
+    def _lasso_cd(self, G, c, beta, q, lamb, active, tol, max_iter):
         '''
-        Creates the design matrix
+        Coordinate descent over the active columns for one lambda. beta and 
+        q = G @ beta are updated in place. Coordinate descent alone has a 
+        very slow tail on correlated columns (like the monomials), so each 
+        sweep is followed by feature-sign steps: with A the non-zero 
+        columns and s their signs, G_AA beta_A = c_A - lamb*s_A is the 
+        minimum on that face. If its signs differ from s, beta moves to the 
+        best point where a coefficient hits zero on the way there, that 
+        coefficient leaves A, and the step is repeated. Once the signs hold 
+        and |c_j - q_j| <= lamb for every other active column (up to tol), 
+        beta is the exact solution. The face system is solved with a 
+        truncated lstsq since G_AA is very ill-conditioned at high degree; 
+        if the face steps stop making progress, only coordinate descent is 
+        used.
+        '''
+        scale = np.sqrt(np.diagonal(G))
+        # objective on the face A for the rows of B, G_AA is sliced once per step
+        objective = lambda B, G_AA, c_A: 0.5*np.sum((B @ G_AA)*B, axis=-1) - B @ c_A \
+                                         + lamb*np.sum(np.abs(B), axis=-1)
+        failed_steps = 0
+        for _ in range(max_iter):
+            max_change = 0
+            for j in active:
+                rho = c[j] - q[j] + G[j, j]*beta[j]
+                new = np.sign(rho) * max(abs(rho) - lamb, 0) / G[j, j]
+                delta = new - beta[j]
+                if delta != 0:
+                    q += delta * G[j]
+                    beta[j] = new
+                    max_change = max(max_change, abs(delta)*scale[j])
+            
+            exact = False
+            while failed_steps < 3 and not exact:
+                A = np.flatnonzero(beta)
+                signs = np.sign(beta[A])
+                G_AA, c_A = G[np.ix_(A, A)], c[A]
+                target = np.linalg.lstsq(G_AA, c_A - lamb*signs, rcond=1e-12)[0]
+                old = beta[A]
+                exact = np.all(np.sign(target) == signs)
+                if not exact:
+                    # points where each sign-changing coefficient hits zero
+                    flips = np.flatnonzero(np.sign(target) != signs)
+                    steps = old[flips]/(old[flips] - target[flips])
+                    candidates = old + steps[:, None]*(target - old)
+                    candidates[np.arange(len(flips)), flips] = 0
+                    target = candidates[np.argmin(objective(candidates, G_AA, c_A))]
+                if objective(target, G_AA, c_A) > objective(old, G_AA, c_A): 
+                    failed_steps += 1
+                    exact = False
+                    break
+                failed_steps = 0
+                beta[A] = target
+                q[:] = G[:, A] @ target
+            
+            zero = active[beta[active] == 0]
+            if exact and np.all(np.abs(c[zero] - q[zero]) <= lamb + tol*scale[zero]): 
+                break
+            if not exact and max_change <= tol: break
+
+    def omp_path(self, X_train, X_test, z_train, z_test, max_terms=None, 
+                 criterion='bic', patience=10, k=5):
+        '''
+        Greedy sparse regression (orthogonal matching pursuit). Columns are 
+        added one at a time, each time the one most correlated with the 
+        current residual, |x_j^T r| / |x_j|, and the model is the OLS fit on 
+        the columns selected so far. The QR factorization of the selected 
+        columns is grown by one column per step with Gram-Schmidt (twice, 
+        for stability), so a step costs O(n k) for the factorization plus 
+        O(n p) for the correlations, and the beta of every step is one 
+        k x k back substitution. Stops after patience steps without an 
+        improvement of the criterion, or at max_terms. For 'cv' the train 
+        rows are split into k folds (shuffled as in kfold()); each fold runs 
+        its own path on the other folds, and the criterion of a path length 
+        is the validation MSE averaged over the folds. The test data is 
+        only used for the reported test MSE.
+        Args: 
+            X_train (2d array): train design matrix
+            X_test (2d array): test design matrix
+            z_train (1d array): train z vector
+            z_test (1d array): test z vector
+            max_terms (int): largest number of columns, defaults to all
+            criterion (str): 'bic' (n log(RSS/n) + k log n), 'aic' 
+                (n log(RSS/n) + 2k) or 'cv' (k-fold cross-validation MSE)
+            patience (int): number of steps without improvement before stopping
+            k (int): number of folds for criterion='cv'
+        Returns: 
+            selected (1d array): column indices, in the order they were added
+            betas (2d array): shape (p, steps), regression parameters after 
+                each step (zero for the columns not selected yet)
+            error (1d array): test MSE after each step
+            error_train (1d array): train MSE after each step
+            ic (1d array): criterion after each step
+            best (int): step with the best criterion; the model with 
+                best + 1 columns is betas[:, best]
+        '''
+        if criterion not in ('bic', 'aic', 'cv'):
+            raise ValueError("Unknown criterion '{}', use 'bic', 'aic' or 'cv'".format(criterion))
+        n, p = X_train.shape
+        if max_terms is None: max_terms = min(n, p)
+        
+        if criterion == 'cv':
+            rows = shuffle(np.arange(n), random_state=42)
+            folds = np.array_split(rows, k)
+            # the paths of all folds are run step by step together, until 
+            # the mean validation MSE has not improved for patience steps
+            paths = [self._omp_steps(X_train[np.setdiff1d(rows, fold)], 
+                                     z_train[np.setdiff1d(rows, fold)], max_terms) 
+                     for fold in folds]
+            cv, best = [], 0
+            for step, fold_steps in enumerate(zip(*paths)):
+                cv.append(np.mean([self.MSE(z_train[fold], X_train[fold][:, selected] @ beta_sel) 
+                                   for fold, (selected, beta_sel, _) in zip(folds, fold_steps)]))
+                if cv[-1] < cv[best]:
+                    best = step
+                elif step - best >= patience:
+                    break
+            max_terms = len(cv)
+        
+        betas, error, error_train, ic = [], [], [], []
+        best_ic, best = np.inf, 0
+        for step, (selected, beta_sel, rss) in enumerate(
+                self._omp_steps(X_train, z_train, max_terms)):
+            beta = np.zeros(p)
+            beta[selected] = beta_sel
+            betas.append(beta)
+            error_train.append(rss/n)
+            error.append(self.MSE(z_test, X_test[:, selected] @ beta_sel))
+            if criterion == 'bic':
+                ic.append(n*np.log(rss/n) + (step+1)*np.log(n))
+            elif criterion == 'aic':
+                ic.append(n*np.log(rss/n) + 2*(step+1))
+            else:
+                ic.append(cv[step])
+            
+            if ic[-1] < best_ic:
+                best_ic, best = ic[-1], step
+            elif step - best >= patience:
+                break
+        return (np.array(selected), np.array(betas).T, np.array(error), 
+                np.array(error_train), np.array(ic), best)
+    
+    def _omp_steps(self, X, z, max_terms):
+        '''
+        The greedy steps of omp_path(). Yields, after every added column, 
+        the selected column indices (a list that keeps growing), their 
+        parameters and the residual sum of squares.
+        '''
+        n, p = X.shape
+        max_terms = min(max_terms, n, p)
+        norms = np.linalg.norm(X, axis=0)
+        candidate = norms > 0
+        Q = np.empty((n, max_terms))
+        R = np.zeros((max_terms, max_terms))
+        Qtz = np.empty(max_terms)
+        residual = np.array(z, dtype=float)
+        
+        selected = []
+        while len(selected) < max_terms and np.any(candidate):
+            k = len(selected)
+            score = np.where(candidate, np.abs(X.T @ residual), -1) / \
+                    np.where(candidate, norms, 1)
+            j = np.argmax(score)
+            candidate[j] = False
+            
+            if not self._qr_add_column(Q, R, k, X[:, j], 1e-10*norms[j]):
+                continue    # (numerically) in the span of the selected columns
+            Qtz[k] = Q[:, k] @ z
+            residual -= Qtz[k]*Q[:, k]
+            selected.append(j)
+            
+            beta_sel = scipy.linalg.solve_triangular(R[:k+1, :k+1], Qtz[:k+1])
+            yield selected, beta_sel, max(residual @ residual, np.finfo(float).tiny)
+    
+    def design_matrix(self, x, y, order='F'):
+        '''
+        Creates the design matrix. The powers (or basis functions) of x and y 
+        are made once per axis by recurrence (x^k = x^(k-1) * x, see vander), 
+        and every column is written straight into a preallocated array. The 
+        columns with y-exponent j are one block product V_x[:, :d-j+1] * V_y[:, j].
         Args:
             x (1d array): x-coordinates 
             y (1d array): y-coordinates
-            degree (int): degree of polynomial in model
+            order (str): memory layout of X, 'F' (column-major, the layout of 
+                the old list-of-columns builder, good for column operations 
+                and X^T X) or 'C' (row-major, good for row slicing and X @ beta 
+                on row blocks). Default 'F'.
         Returns: 
             X (2d array): design matrix
         '''
-        X = []
+        x = np.asarray(x, dtype=float)
+        shape = x.shape
+        V_x = self.vander(x.ravel(), 0)
+        V_y = self.vander(np.ravel(y), 1)
+        n_cols = (self.degree +1)*(self.degree +2)//2
+        X = np.empty((x.size, n_cols), order=order)
+        col = 0
         for y_exp in range(self.degree +1):
-            for x_exp in range(self.degree +1):
-                if y_exp + x_exp <= self.degree:
-                    X.append(x**x_exp * y**y_exp)
-        X = (np.array(X).T).squeeze()
-        return X
+            n_x = self.degree - y_exp +1
+            np.multiply(V_x[:, :n_x], V_y[:, y_exp:y_exp+1], 
+                        out=X[:, col:col+n_x])
+            col += n_x
+        return X.reshape(shape + (n_cols,)).squeeze()
+    
+    def design_matrix_chunks(self, x, y, chunk_size=100000, order='C'):
+        '''
+        Design matrix in row blocks, for inputs too large to hold X in memory. 
+        Yields design_matrix(x[start:stop], y[start:stop]) for consecutive 
+        blocks of chunk_size points.
+        Args:
+            x (1d array): x-coordinates 
+            y (1d array): y-coordinates
+            chunk_size (int): number of rows per block
+            order (str): memory layout of each block, see design_matrix
+        Yields: 
+            start (int): index of the first row of the block
+            X (2d array): design matrix of the block
+        '''
+        for start in range(0, len(x), chunk_size):
+            X = self.design_matrix(x[start:start+chunk_size], 
+                                   y[start:start+chunk_size], order=order)
+            yield start, X.reshape(-1, self.n_columns())
+    
+    def vander(self, t, axis):
+        '''
+        1d basis functions of degree 0..self.degree in self.basis, evaluated 
+        at t
+        Args:
+            t (1d array): x-coordinates (axis=0) or y-coordinates (axis=1)
+            axis (int): 0 for x, 1 for y (selects the domain of the mapping)
+        Returns: 
+            V (2d array): shape (len(t), degree+1), column i is basis function i
+        '''
+        t = np.asarray(t, dtype=float)
+        if self.basis == 'monomial':
+            return np.polynomial.polynomial.polyvander(t, self.degree)
+        low, high = self.domain[axis]
+        t = (2*t - low - high) / (high - low)
+        if self.basis == 'legendre':
+            return np.polynomial.legendre.legvander(t, self.degree)
+        if self.basis == 'chebyshev':
+            return np.polynomial.chebyshev.chebvander(t, self.degree)
+        raise ValueError("Unknown basis '{}'".format(self.basis))
+    
+    def to_monomial(self, beta):
+        '''
+        Convert regression parameters in self.basis to the parameters of the 
+        same polynomial in the monomial basis x^i y^j (in design_matrix() 
+        order of a monomial model of the same degree).
+        Args: 
+            beta (1d array): regression parameters in self.basis
+        Return: 
+            beta (1d array): regression parameters in the monomial basis
+        '''
+        if self.basis == 'monomial':
+            return beta
+        kinds = {'legendre': np.polynomial.Legendre, 
+                 'chebyshev': np.polynomial.Chebyshev}
+        # C[axis][m, i]: coefficient of t^m in basis function i on that axis
+        C = []
+        for axis in range(2):
+            C.append(np.zeros((self.degree +1, self.degree +1)))
+            for i in range(self.degree +1):
+                poly = kinds[self.basis].basis(i, domain=self.domain[axis])
+                coef = poly.convert(kind=np.polynomial.Polynomial).coef
+                C[axis][:len(coef), i] = coef
+        x_exps, y_exps = self.exponents()
+        T = C[0][np.ix_(x_exps, x_exps)] * C[1][np.ix_(y_exps, y_exps)]
+        return T @ beta
+
+    def n_columns(self):
+        '''
+        Number of columns of the design matrix
+        '''
+        return (self.degree +1)*(self.degree +2)//2
+    
+    def exponents(self, degree=None):
+        '''
+        Exponents of x and y for each column of the design matrix, in the same 
+        order as design_matrix()
+        Args:
+            degree (int): degree of polynomial, defaults to self.degree
+        Returns: 
+            x_exps (1d array): exponent of x in each column
+            y_exps (1d array): exponent of y in each column
+        '''
+        if degree is None: degree = self.degree
+        x_exps, y_exps = [], []
+        for y_exp in range(degree +1):
+            for x_exp in range(degree +1):
+                if y_exp + x_exp <= degree:
+                    x_exps.append(x_exp)
+                    y_exps.append(y_exp)
+        return np.array(x_exps), np.array(y_exps)
+    
+    def gram_matrix(self, x, y, z, chunk_size=100000):
+        '''
+        X^T X and X^T z of the design matrix of x and y, without making the 
+        design matrix. Every entry of X^T X is a moment sum(x^a * y^b) with 
+        a+b <= 2*degree, and every entry of X^T z is sum(x^a * y^b * z) with 
+        a+b <= degree, so only O(degree^2) moments are computed (in one pass 
+        over the data, chunk_size points at a time) and the p x p matrices 
+        are filled by lookup.
+        Args:
+            x (1d array): x-coordinates 
+            y (1d array): y-coordinates
+            z (1d array): z vector
+            chunk_size (int): number of points handled at a time
+        Returns: 
+            XtX (2d array): X^T X
+            Xtz (1d array): X^T z
+        '''
+        if self.basis != 'monomial':
+            raise ValueError("gram_matrix needs basis='monomial'")
+        deg = self.degree
+        moments = np.zeros((2*deg +1, 2*deg +1))
+        moments_z = np.zeros((deg +1, deg +1))
+        for start in range(0, len(x), chunk_size):
+            x_c = x[start:start+chunk_size]
+            y_c = y[start:start+chunk_size]
+            z_c = z[start:start+chunk_size]
+            x_pow = np.cumprod(np.column_stack(
+                [np.ones_like(x_c)] + [x_c]*(2*deg)), axis=1)
+            y_pow = np.cumprod(np.column_stack(
+                [np.ones_like(y_c)] + [y_c]*(2*deg)), axis=1)
+            moments += x_pow.T @ y_pow
+            moments_z += x_pow[:, :deg+1].T @ (y_pow[:, :deg+1] * z_c[:, None])
+        
+        x_exps, y_exps = self.exponents()
+        XtX = moments[x_exps[:, None] + x_exps[None, :], 
+                      y_exps[:, None] + y_exps[None, :]]
+        Xtz = moments_z[x_exps, y_exps]
+        return XtX, Xtz
+    
+    def fit_stream(self, blocks, model='OLS', lamb=None, test_size=0, seed=42):
+        '''
+        OLS or Ridge on data that comes in blocks (e.g. the row blocks of a 
+        raster from terrain.terrain_blocks), with memory bounded by the block 
+        size. Each block is split at random in train and test, and only the 
+        train rows are added to X^T X and X^T z (from power-sum moments with 
+        gram_matrix() for the monomial basis, else from the design rows); the 
+        p x p system is solved once at the end. The data is not centered 
+        (the intercept column is kept), as with split=False.
+        Args:
+            blocks (iterable): yields (x, y, z) 1d arrays of each block
+            model (str): 'OLS' or 'Ridge'
+            lamb (float): lambda value for Ridge, defaults to self.lamb
+            test_size (float): fraction of each block held out for testing
+            seed (int): seed of the split. score_stream() with the same seed 
+                and the blocks in the same order makes the same split
+        Return: 
+            beta (1d array): regression parameters, also stored in self.beta
+        '''
+        if model == 'OLS':
+            lamb = 0
+        elif lamb is None: 
+            lamb = self.lamb
+        rng = np.random.default_rng(seed)
+        n_cols = self.n_columns()
+        XtX = np.zeros((n_cols, n_cols))
+        Xtz = np.zeros(n_cols)
+        for x, y, z in blocks:
+            train = rng.random(len(z)) >= test_size
+            x, y = np.ravel(x)[train], np.ravel(y)[train]
+            z = np.asarray(z, dtype=float)[train]
+            if self.basis == 'monomial':
+                XtX_block, Xtz_block = self.gram_matrix(x, y, z)
+            else:
+                X = self.design_matrix(x, y).reshape(-1, n_cols)
+                XtX_block, Xtz_block = X.T @ X, X.T @ z
+            XtX += XtX_block
+            Xtz += Xtz_block
+        self.beta = self._solve_gram(XtX, Xtz, lamb)
+        return self.beta
+    
+    def partial_fit(self, x, y, z, model='OLS', lamb=None, forgetting=1.0):
+        '''
+        Online (recursive least squares) fit: add a batch of points to the 
+        model and update beta and P = (X^T X + lamb I)^-1 with the Woodbury 
+        identity, without refitting on the earlier batches. For a batch X_b 
+        of k rows and forgetting factor f (older points are weighted by f at 
+        every batch):
+            K = P X_b^T (f I_k + X_b P X_b^T)^-1
+            beta <- beta + K (z - X_b beta)
+            P <- (P - K X_b P) / f
+        which costs O(k p^2 + k^3) per batch. Until the points seen so far 
+        give a Gram matrix with a condition estimate below 1e10, X^T X and 
+        X^T z are summed instead and beta is their pinv solution; P is then 
+        computed once from the exact Gram matrix, so no regularization is 
+        added to start the updates. 
+        The data is not centered (the intercept column is kept), as with 
+        split=False. An orthogonal basis keeps the updates well conditioned.
+        Args:
+            x (1d array): x-coordinates of the batch
+            y (1d array): y-coordinates of the batch
+            z (1d array): z vector of the batch
+            model (str): 'OLS' or 'Ridge', used by the first call
+            lamb (float): lambda value for Ridge, defaults to self.lamb
+            forgetting (float): weight f in (0, 1] of the old data at every 
+                batch, 1 keeps all data
+        Return: 
+            beta (1d array): regression parameters after the batch, also 
+                stored in self.beta
+        '''
+        n_cols = self.n_columns()
+        X = self.design_matrix(x, y).reshape(-1, n_cols)
+        z = np.asarray(z, dtype=float)
+        if self.P is None:
+            if model == 'OLS': 
+                lamb = 0
+            elif lamb is None: 
+                lamb = self.lamb
+            if self.G_seen is None:
+                self.G_seen, self.b_seen = lamb*np.eye(n_cols), np.zeros(n_cols)
+            # same weights as the updates below: old data (and lamb) times f
+            self.G_seen = forgetting*self.G_seen + X.T @ X
+            self.b_seen = forgetting*self.b_seen + X.T @ z
+            try:
+                L = np.linalg.cholesky(self.G_seen)
+                cond = self._cond_cholesky(self.G_seen, L)
+            except np.linalg.LinAlgError:
+                cond = np.inf
+            if cond > 1e10:
+                self.beta = self._svd_gram(self.G_seen, self.b_seen)[0]
+                return self.beta
+            self.P = scipy.linalg.cho_solve((L, True), np.eye(n_cols))
+            self.beta = scipy.linalg.cho_solve((L, True), self.b_seen)
+            self.G_seen, self.b_seen = None, None
+            return self.beta
+        
+        PXt = self.P @ X.T
+        K = np.linalg.solve(forgetting*np.eye(len(z)) + X @ PXt, PXt.T).T
+        self.beta = self.beta + K @ (z - X @ self.beta)
+        self.P = (self.P - K @ PXt.T)/forgetting
+        self.P = (self.P + self.P.T)/2
+        return self.beta
+    
+    def score_stream(self, blocks, beta=None, test_size=0, seed=42):
+        '''
+        Second pass over the blocks of fit_stream(): MSE and R2 on the train 
+        and test rows, with the same split (same seed, same block order). 
+        Only running sums are kept, so memory is bounded by the block size.
+        Args:
+            blocks (iterable): yields (x, y, z) 1d arrays of each block
+            beta (1d array): regression parameters, defaults to self.beta
+            test_size (float): as in fit_stream()
+            seed (int): as in fit_stream()
+        Return: 
+            mse_train, r2_train, mse_test, r2_test (float): nan for an empty set
+        '''
+        if beta is None: beta = self.beta
+        rng = np.random.default_rng(seed)
+        # count, sum z, sum z^2, sum of squared errors; row 0 train, row 1 test
+        sums = np.zeros((2, 4))
+        for x, y, z in blocks:
+            z = np.asarray(z, dtype=float)
+            resid = z - self.design_matrix(x, y).reshape(len(z), -1) @ beta
+            test = rng.random(len(z)) < test_size
+            for i, rows in enumerate([~test, test]):
+                sums[i] += [np.count_nonzero(rows), np.sum(z[rows]), 
+                            np.sum(z[rows]**2), np.sum(resid[rows]**2)]
+        scores = []
+        for n, sum_z, sum_z2, sse in sums:
+            if n == 0:
+                scores += [np.nan, np.nan]
+                continue
+            scores += [sse/n, 1 - sse/(sum_z2 - sum_z**2/n)]
+        return tuple(scores)
+    
+    def _solve_gram(self, XtX, Xtz, lamb=0):
+        '''
+        Solve the least squares problem given only X^T X and X^T z with 
+        _solve(): with XtX = V diag(w) V^T, the rows A = diag(sqrt(w)) V^T and 
+        b = diag(1/sqrt(w)) V^T Xtz have A^T A = XtX and A^T b = Xtz, so they 
+        give the same beta. Directions with w below the pinv cutoff are left 
+        out.
+        '''
+        w, V = np.linalg.eigh(XtX)
+        keep = w > len(w)*np.finfo(float).eps*max(w.max(), 0)
+        w, V = w[keep], V[:, keep]
+        A = np.sqrt(w)[:, None] * V.T
+        b = (V.T @ Xtz) / np.sqrt(w)
+        return self._solve(A, b, lamb)
+    
+    def degree_columns(self, degree):
+        '''
+        Indices of the columns of the design matrix (made with self.degree) 
+        that form the design matrix of a lower degree polynomial. 
+        X[:, reg.degree_columns(d)] equals the design matrix of degree d.
+        '''
+        x_exps, y_exps = self.exponents()
+        return np.flatnonzero(x_exps + y_exps <= degree)
+    
+    def degree_sweep(self, X_train, X_test, z_train, z_test, degrees=None, 
+                     model='OLS', lamb=None):
+        '''
+        Fit every degree in degrees from one design matrix of degree 
+        self.degree. The columns are sorted by total degree so that each 
+        lower degree is a leading block, and two factorizations are shared 
+        by all degrees (per lambda):
+            - one Cholesky factorization of X^T X, whose leading blocks are 
+              the factorizations of the lower degrees. The LAPACK condition 
+              estimate of a leading block grows with its size, so the 
+              largest degree with an estimate below 1e10 is found by 
+              bisection, and the degrees up to it are solved from L.
+            - for the higher degrees, one QR factorization of X (stacked on 
+              sqrt(lamb) I for Ridge), grown a degree at a time in the same 
+              order. Columns whose remainder is below 1e-6 times the largest 
+              singular value of X are left out, so the condition number of 
+              X^T X stays below about 1e12 without squaring it, and every 
+              degree is a back substitution with the leading block of R. 
+              Where columns are left out this is the basic least squares 
+              solution (zeros for those columns), not the minimum norm one 
+              of pinv.
+        Args: 
+            X_train (2d array): train design matrix of degree self.degree
+            X_test (2d array): test design matrix of degree self.degree
+            z_train (1d array): train z vector
+            z_test (1d array): test z vector
+            degrees (list[int]): degrees to fit, defaults to 1..self.degree
+            model (str): 'OLS' or 'Ridge'
+            lamb (float or 1d array): value of lambda for Ridge, defaults to 
+                self.lamb. For an array X^T X is shared by all lambdas
+        Returns: 
+            betas (list[1d array]): regression parameters for each degree 
+                (2d, one column per lambda, if lamb is an array)
+            error (1d array): test MSE for each degree (2d, shape 
+                (len(degrees), len(lamb)), if lamb is an array)
+            error_train (1d array): train MSE for each degree (as error)
+        '''
+        if degrees is None: degrees = range(1, self.degree +1)
+        if lamb is None: lamb = self.lamb
+        if model == 'OLS': lamb = 0
+        lambs = np.atleast_1d(lamb).astype(float)
+        
+        x_exps, y_exps = self.exponents()
+        order = np.argsort(x_exps + y_exps, kind='stable')
+        # Zero columns (e.g. the intercept after centering) get beta = 0, 
+        # like with pinv. The rest is factorized once per lambda.
+        live = order[np.any(X_train[:, order] != 0, axis=0)]
+        X_live = X_train[:, live]
+        G = X_live.T @ X_live
+        b = X_live.T @ z_train
+        
+        n_cols = [np.count_nonzero(x_exps + y_exps <= deg) for deg in degrees]
+        # number of live columns of each degree, in increasing order
+        sizes = np.unique([np.count_nonzero(np.isin(live, order[:n])) for n in n_cols])
+        betas = [np.zeros((n, len(lambs))) for n in n_cols]
+        error = np.zeros((len(degrees), len(lambs)))
+        error_train = np.zeros((len(degrees), len(lambs)))
+        for k, lamb_k in enumerate(lambs):
+            G_lamb = G + lamb_k*np.eye(len(live))
+            # on failure the leading block of order info-1 is still factorized
+            L, info = scipy.linalg.lapack.dpotrf(G_lamb, lower=1, clean=1)
+            n_chol = info - 1 if info > 0 else len(live)
+            lo, hi = 0, len(sizes)
+            while lo < hi:
+                mid = (lo + hi)//2
+                m = sizes[mid]
+                if m <= n_chol and self._cond_cholesky(G_lamb[:m, :m], L[:m, :m]) < 1e10:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            m_chol = sizes[lo-1] if lo > 0 else 0
+            
+            if m_chol < sizes[-1]:
+                X_aug, z_aug = self._stack_ridge(X_live[:, :sizes[-1]], z_train, lamb_k)
+                # largest singular value of X (stacked on sqrt(lamb) I)
+                s_max = np.sqrt(scipy.sparse.linalg.eigsh(G_lamb, k=1, 
+                                return_eigenvectors=False)[0])
+                Q = np.empty((len(X_aug), sizes[-1]), order='F')
+                R = np.zeros((sizes[-1], sizes[-1]))
+                kept = []
+                for start, stop in zip(np.r_[0, sizes[:-1]], sizes):
+                    # the new columns of a degree are projected out of Q in 
+                    # one block (twice, for stability), then added one at a time
+                    q, V, C = len(kept), X_aug[:, start:stop].copy(), 0
+                    for _ in range(2):
+                        c = Q[:, :q].T @ V
+                        V -= Q[:, :q] @ c
+                        C += c
+                    for j in range(stop - start):
+                        if self._qr_add_column(Q[:, q:], R[q:, q:], len(kept) - q, 
+                                               V[:, j], 1e-6*s_max):
+                            R[:q, len(kept)] = C[:, j]
+                            kept.append(start + j)
+                kept = np.array(kept, dtype=int)
+                Qtz = Q[:, :len(kept)].T @ z_aug
+            
+            for i, n in enumerate(n_cols):
+                m = np.count_nonzero(np.isin(live, order[:n]))
+                beta = np.zeros(len(X_train.T))
+                if m <= m_chol:
+                    beta[live[:m]] = scipy.linalg.cho_solve((L[:m, :m], True), b[:m])
+                else:
+                    n_kept = np.searchsorted(kept, m)
+                    beta[live[kept[:n_kept]]] = scipy.linalg.solve_triangular(
+                        R[:n_kept, :n_kept], Qtz[:n_kept])
+                # back to design_matrix() column order
+                cols = np.sort(order[:n])
+                betas[i][:, k] = beta[cols]
+                error[i, k] = self.MSE(z_test, X_test[:, cols] @ betas[i][:, k])
+                error_train[i, k] = self.MSE(z_train, X_train[:, cols] @ betas[i][:, k])
+        
+        if np.ndim(lamb) == 0:
+            return [beta[:, 0] for beta in betas], error[:, 0], error_train[:, 0]
+        return betas, error, error_train
 
+    def adaptive_sweep(self, score, degrees, patience=3, stride=1):
+        '''
+        Score degrees without fitting all of them. score(degree) returns the 
+        values of one degree (e.g. test MSE, train MSE), the first of which 
+        is the validation error that is minimized. The degrees are scored 
+        in increasing order, every stride-th one, and the sweep stops when 
+        the validation error has not improved on its minimum for patience 
+        scored degrees in a row. With stride > 1 the skipped degrees next 
+        to the minimum are then bisected: the wider gap beside the current 
+        best degree is halved until both neighbours of the best have been 
+        scored, so a unimodal error curve gets its exact minimum with 
+        O(log stride) extra fits.
+        Args: 
+            score (function): score(degree) -> float or 1d array
+            degrees (list[int]): increasing degrees
+            patience (int): number of scored degrees without improvement 
+                before stopping
+            stride (int): step of the first pass
+        Returns: 
+            scores (2d array): shape (len(degrees), number of values), NaN 
+                for the degrees that were not scored
+            scored (1d array): True for the degrees that were scored
+            saved (float): fraction of the work of a full sweep that was 
+                skipped, counting a degree as (number of columns)^2 like 
+                the cost of X^T X
+        '''
+        degrees = list(degrees)
+        results = {}
+        def evaluate(i):
+            results[i] = np.atleast_1d(score(degrees[i])).astype(float)
+            return results[i][0]
+        
+        best, best_error, since_best = 0, np.inf, 0
+        for i in range(0, len(degrees), stride):
+            error = evaluate(i)
+            if error < best_error:
+                best, best_error, since_best = i, error, 0
+            else:
+                since_best += 1
+                if since_best >= patience: break
+        else:
+            # no early stop: the last degree bounds the bisection
+            if len(degrees) -1 not in results and evaluate(len(degrees) -1) < best_error:
+                best, best_error = len(degrees) -1, results[len(degrees) -1][0]
+        
+        while True:
+            left = max([i for i in results if i < best], default=best)
+            right = min([i for i in results if i > best], default=best)
+            gaps = [(best - left, (left + best)//2), (right - best, (best + right +1)//2)]
+            gap, mid = max(gaps)
+            if gap <= 1: 
+                break
+            error = evaluate(mid)
+            if error < best_error:
+                best, best_error = mid, error
+        
+        scored = np.zeros(len(degrees), dtype=bool)
+        scored[list(results)] = True
+        scores = np.full((len(degrees), len(results[best])), np.nan)
+        for i, values in results.items():
+            scores[i] = values
+        work = np.array([(d +1)*(d +2)//2 for d in degrees])**2
+        saved = 1 - np.sum(work[scored])/np.sum(work)
+        return scores, scored, saved
+    
     def predict(self, X, beta,intercept=0):
         '''
         Predicts z values from regression parameters and the design matrix
@@ -236,6 +1337,30 @@ class LinearRegression():
         '''
         return (X @ beta)+intercept
         
+    def predict_grid(self, x_axis, y_axis, beta=None, intercept=0):
+        '''
+        Predicts z on the grid np.meshgrid(x_axis, y_axis) without making its 
+        design matrix. The polynomial sum_ij B[j,i] f_i(x) f_j(y) evaluated on 
+        the grid is V_y @ B @ V_x^T, with V_x, V_y the 1d Vandermonde (or basis) 
+        matrices of the axes, so memory is O((len(x_axis)+len(y_axis))*degree) 
+        plus the output, instead of O(len(x_axis)*len(y_axis)*degree^2). 
+        Gives the same values as predict(design_matrix(x_2d.ravel(), 
+        y_2d.ravel()), beta, intercept), reshaped to the grid.
+        Args: 
+            x_axis (1d array): x-coordinates of the grid columns
+            y_axis (1d array): y-coordinates of the grid rows
+            beta (1d array): regression parameters, defaults to self.beta
+            intercept (float): added to every prediction
+        Return: 
+            z_2d (2d array): shape (len(y_axis), len(x_axis)), predicted 
+                z-values, z_2d[i, j] at (x_axis[j], y_axis[i])
+        '''
+        if beta is None: beta = self.beta
+        x_exps, y_exps = self.exponents()
+        B = np.zeros((self.degree +1, self.degree +1))
+        B[y_exps, x_exps] = beta
+        return self.vander(y_axis, 1) @ B @ self.vander(x_axis, 0).T + intercept
+        
     def plot(self, x_2d, y_2d, z):
         '''
         Plot a z vector (after reshaping) given a x and y mesh.
@@ -260,39 +1385,109 @@ class LinearRegression():
         plt.show()
     
         
+    # The scores are column-wise: for (n, m) z and z_model (m targets) they 
+    # return one value per column
     def MSE(self, z, z_model):
-        sum_sq_error = np.sum((z - z_model) ** 2)
+        sum_sq_error = np.sum((z - z_model) ** 2, axis=0)
         mse = sum_sq_error/len(z_model)
         
         return mse
     
     def R2(self, z_test, z_model):
-        sum_sq_error = np.sum((z_test - z_model) ** 2)
-        sum_sq_res = np.sum((z_test - np.mean(z_test)) ** 2)
+        sum_sq_error = np.sum((z_test - z_model) ** 2, axis=0)
+        sum_sq_res = np.sum((z_test - np.mean(z_test, axis=0)) ** 2, axis=0)
         
         return 1 - (sum_sq_error / sum_sq_res)
     
     def bias(self, z, z_model):
         
-        return np.mean((np.mean(z_model) - z)**2)
+        return np.mean((np.mean(z_model, axis=0) - z)**2, axis=0)
     
     
     def var(self, z_model):
         
-        var_numpy = np.var(z_model)
-        var = np.mean((np.mean(z_model)-z_model)**2)
-        if var_numpy != var:
+        var_numpy = np.var(z_model, axis=0)
+        var = np.mean((np.mean(z_model, axis=0)-z_model)**2, axis=0)
+        if np.any(var_numpy != var):
             print('Warning: Something is wrong with variance')
         return var
         
     def beta_variance(self, X, sigma_sq = 1):
         return np.diagonal( sigma_sq * (np.linalg.pinv(X.T @ X)))
+    
+    def fit(self, X, z, model='OLS', lamb=None, sigma_sq=None):
+        '''
+        OLS or Ridge fit that keeps its factorization, for diagnostics 
+        without refitting (see RegressionResult).
+        Args: 
+            X (2d array): design matrix
+            z (1d array): z vector
+            model (str): 'OLS' or 'Ridge'
+            lamb (float): lambda value for Ridge, defaults to self.lamb
+            sigma_sq (float): noise variance, estimated from the residuals 
+                if None
+        Return: 
+            result (RegressionResult)
+        '''
+        if model == 'OLS':
+            lamb = 0
+        elif model == 'Ridge':
+            if lamb is None: lamb = self.lamb
+        else:
+            raise ValueError("fit supports 'OLS' and 'Ridge', not '{}'".format(model))
+        return RegressionResult(self, X, z, lamb, sigma_sq)
 
     
-    # TODO MSE train not working, else fine
+    def bias_variance_analytic(self, X_train, X_test, f_train, f_test, sigma_sq, 
+                               model='OLS', lamb=0):
+        '''
+        Exact bias-variance decomposition of OLS/Ridge over the noise, when 
+        the true function f and the noise variance sigma^2 are known (e.g. 
+        the Franke function): the train data is z = f_train + noise, and the 
+        prediction X_test A z with A = (X^T X + lamb I)^-1 X^T is linear in z, so
+            E[prediction] = X_test A f_train
+            Var[prediction_i] = sigma^2 x_i^T (X^T X + lamb I)^-1 X^T X 
+                                (X^T X + lamb I)^-1 x_i
+        With the thin SVD X_train = U diag(s) V^T and the filter 
+        d = s/(s^2 + lamb), X_test A = (X_test V) diag(d) U^T, so one SVD gives 
+        every lambda. This replaces the bootstrap estimate of the same 
+        quantities.
+        Args: 
+            X_train (2d array): train design matrix
+            X_test (2d array): test design matrix
+            f_train (1d array): noise-free function at the train points
+            f_test (1d array): noise-free function at the test points
+            sigma_sq (float): variance of the noise
+            model (str): 'OLS' or 'Ridge'
+            lamb (float or 1d array): value(s) of lambda for Ridge
+        Returns: 
+            error (float or 1d array): expected test MSE against noisy test 
+                data, bias + variance + sigma^2
+            bias (float or 1d array): mean squared bias against f_test
+            variance (float or 1d array): mean variance of the predictions
+        '''
+        lambs = np.atleast_1d(lamb).astype(float)
+        if model == 'OLS': lambs = np.zeros(1)
+        U, s, Vt = np.linalg.svd(X_train, full_matrices=False)
+        d = self._ridge_filter(s, lambs)
+        XV = X_test @ Vt.T
+        mean_pred = XV @ (d * (U.T @ f_train)[:, None])
+        bias = np.mean((f_test[:, None] - mean_pred)**2, axis=0)
+        variance = sigma_sq * np.mean(XV**2 @ d**2, axis=0)
+        error = bias + variance + sigma_sq
+        if np.ndim(lamb) == 0 or model == 'OLS':
+            return error[0], bias[0], variance[0]
+        return error, bias, variance
+    
     def bootstrap(self, X_train, X_test, z_train, z_test, bootstrap_nr=None, model='OLS', lamb=0):
         """
-        Bootstrap sampling. 
+        Bootstrap sampling. All resamples are drawn at once as a 
+        (bootstrap_nr, n) matrix of row indices (the same draws as 
+        sklearn.utils.resample in a loop). For OLS and Ridge a resample only 
+        enters through its row counts w_b, so the Gram matrices 
+        X^T diag(w_b) X are built and solved in fixed-size batches (see 
+        _bootstrap_betas()) and every replicate is predicted with one matmul. 
+        Lasso is fitted resample by resample.
         Args: 
             X_train (2d array): train design matrix
             X_test (2d array): test design matrix
@@ -301,6 +1496,87 @@ class LinearRegression():
             bootstrap_nr: number of bootstraps, defaults to len(z_train)
             model (str): Regression model used. 'OLS', 'Ridge', or 'Lasso' 
             Defaults to OLS. 
+            lamb (float or 1d array): value of lambda for Ridge and Lasso 
+                regressions. Ridge also takes an array of lambdas, all fitted 
+                on the same resamples.
+            
+        Returns: 
+            error (float or 1d array): test MSE (one per lambda if lamb is an 
+                array)
+            bias (float or 1d array)
+            variance (float or 1d array)
+            error_train (float or 1d array): tain MSE
+        """
+        
+        if not bootstrap_nr: bootstrap_nr = len(z_train)
+        
+        z_model, error_train = self._bootstrap_replicates(X_train, X_test, z_train, 
+                                                          bootstrap_nr, model, lamb)
+        
+        z_test = z_test.reshape((-1,) + (1,)*(z_model.ndim - 2))
+        error = np.mean( (z_test[:, None] - z_model)**2, axis=(0,1) )
+        bias = np.mean( (z_test - np.mean(z_model, axis=1))**2, axis=0 )
+        variance = np.mean( np.var(z_model, axis=1), axis=0 )
+        error_train = np.mean(error_train, axis=0)
+
+        return error, bias, variance, error_train
+    
+    def _bootstrap_replicates(self, X_train, X_test, z_train, bootstrap_nr, model, lamb):
+        '''
+        Draw bootstrap_nr resamples, fit them and predict the test points. 
+        Used by bootstrap() and bootstrap_adaptive().
+        Return: 
+            z_model (2d array): test predictions, one column per resample 
+                (and a third axis over lamb if it is an array)
+            error_train (1d array): train MSE of each resample, each train 
+                point counted as many times as it was drawn
+        '''
+        n = len(z_train)
+        idx = np.random.randint(0, n, (bootstrap_nr, n))
+        # number of times each train point is drawn in each resample
+        weights = np.bincount((idx + n*np.arange(bootstrap_nr)[:, None]).ravel(), 
+                              minlength=n*bootstrap_nr).reshape(bootstrap_nr, n)
+        
+        if model == "Lasso":
+            betas = np.empty((X_train.shape[1], bootstrap_nr))
+            intercepts = np.empty(bootstrap_nr)
+            for i in range(bootstrap_nr):
+                betas[:, i], intercepts[i] = self.Lasso_regression(
+                    X_train[idx[i]], z_train[idx[i]], lamb)
+            z_model = self.predict(X_test, betas, intercepts)
+            z_model_train = self.predict(X_train, betas, intercepts)
+        else:
+            if model == "OLS": lamb = 0
+            betas = self._bootstrap_betas(X_train, z_train, weights, lamb)
+            z_model = np.tensordot(X_test, betas, axes=1)
+            z_model_train = np.tensordot(X_train, betas, axes=1)
+        
+        # extra trailing axis for a lambda array
+        extra = (1,)*(z_model.ndim - 2)
+        error_train = np.mean( weights.T.reshape(weights.T.shape + extra) 
+                               * (z_train.reshape((-1, 1) + extra) - z_model_train)**2, axis=0 )
+        return z_model, error_train
+    
+    def bootstrap_adaptive(self, X_train, X_test, z_train, z_test, tol=0.01, 
+                           batch_size=20, max_nr=None, model='OLS', lamb=0):
+        """
+        Bootstrap that chooses the number of resamples. Resamples are drawn 
+        and fitted batch_size at a time (with the batched engine of 
+        bootstrap()), the test predictions are folded into running per-point 
+        means and variances (_welford_update), and the standard errors of 
+        the MSE, bias and variance estimates are estimated from the spread 
+        of the per-batch estimates (batch means). Sampling stops when every 
+        standard error is below tol times its estimate, or at max_nr 
+        resamples.
+        Args: 
+            X_train (2d array): train design matrix
+            X_test (2d array): test design matrix
+            z_train (1d array): train z vector
+            z_test (1d array): test z vector
+            tol (float): relative tolerance of the standard errors
+            batch_size (int): resamples per batch, at least two batches are run
+            max_nr (int): largest number of resamples, defaults to len(z_train)
+            model (str): Regression model used. 'OLS', 'Ridge', or 'Lasso' 
             lamb (float): value of lambda for Ridge and Lasso regressions
             
         Returns: 
@@ -308,56 +1584,205 @@ class LinearRegression():
             bias (float)
             variance (float)
             error_train (float): tain MSE
+            bootstrap_nr (int): number of resamples used
         """
+        if not max_nr: max_nr = len(z_train)
+        count = 0
+        mean = np.zeros(len(z_test))
+        M2 = np.zeros(len(z_test))
+        sum_sq_error = 0
+        sum_error_train = 0
+        batch_estimates = []
+        while count < max_nr:
+            z_model, error_train = self._bootstrap_replicates(
+                X_train, X_test, z_train, min(batch_size, max_nr - count), model, lamb)
+            sq_error = (z_test.reshape(-1,1) - z_model)**2
+            batch_estimates.append([np.mean(sq_error), 
+                                    np.mean((z_test - np.mean(z_model, axis=1))**2),
+                                    np.mean(np.var(z_model, axis=1))])
+            sum_sq_error += np.sum(sq_error)
+            sum_error_train += np.sum(error_train)
+            count, mean, M2 = self._welford_update(count, mean, M2, z_model)
+            
+            estimates = np.array([sum_sq_error/(count*len(z_test)), 
+                                  np.mean((z_test - mean)**2), np.mean(M2/count)])
+            if len(batch_estimates) >= 2:
+                std_error = np.std(batch_estimates, axis=0, ddof=1)/np.sqrt(len(batch_estimates))
+                if np.all(std_error <= tol*np.abs(estimates)): break
         
+        error, bias, variance = estimates
+        return error, bias, variance, sum_error_train/count, count
+    
+    def bootstrap_poisson(self, X_train, X_test, z_train, z_test, bootstrap_nr=None, 
+                          model='OLS', lamb=0, chunk_size=10000):
+        """
+        Streaming bootstrap for large data sets. Instead of resampling n 
+        rows, each train row gets a Poisson(1) weight, so a replicate can be 
+        accumulated chunk_size rows at a time (X_train and X_test may be 
+        np.memmap arrays). The test predictions of each replicate are folded 
+        into online (Welford) mean/variance accumulators per test point, so 
+        memory is O(n + p^2) independent of bootstrap_nr.
+        Args: 
+            X_train (2d array): train design matrix
+            X_test (2d array): test design matrix
+            z_train (1d array): train z vector
+            z_test (1d array): test z vector
+            bootstrap_nr: number of bootstraps, defaults to len(z_train)
+            model (str): Regression model used. 'OLS' or 'Ridge'
+            lamb (float): value of lambda for Ridge regression
+            chunk_size (int): number of rows handled at a time
+            
+        Returns: 
+            error (float): test MSE
+            bias (float)
+            variance (float)
+            error_train (float): tain MSE
+        """
+        if model not in ("OLS", "Ridge"):
+            raise ValueError("bootstrap_poisson supports 'OLS' and 'Ridge', not {}".format(model))
+        if model == "OLS": lamb = 0
         if not bootstrap_nr: bootstrap_nr = len(z_train)
+        n, p = X_train.shape
+        chunks = range(0, n, chunk_size)
+        test_chunks = range(0, len(z_test), chunk_size)
         
-        z_model = np.empty((len(z_test), bootstrap_nr))
-        z_model_train = np.empty((len(z_train), bootstrap_nr))
-        z_train_matrix = np.empty((len(z_train), bootstrap_nr))
-        z_test_matrix = np.empty((len(z_test), bootstrap_nr))
-        
+        count = 0
+        mean = np.zeros(len(z_test))
+        M2 = np.zeros(len(z_test))
+        sum_sq_error = 0
+        error_train = 0
         for i in range(bootstrap_nr):
+            weights = np.random.poisson(1, n)
+            G = lamb*np.eye(p)
+            b = np.zeros(p)
+            for start in chunks:
+                X_c = X_train[start:start+chunk_size]
+                w_c = weights[start:start+chunk_size]
+                G += X_c.T @ (w_c[:, None] * X_c)
+                b += X_c.T @ (w_c * z_train[start:start+chunk_size])
+            beta = np.linalg.pinv(G) @ b
             
-            tmp_X_train, tmp_z_train = resample(X_train, z_train, replace=True)
-
-            if model == "OLS": tmp_beta = self.OLS(tmp_X_train, tmp_z_train)
-            if model == "Ridge": tmp_beta = self.Ridge_regression(tmp_X_train, tmp_z_train,lamb)
-            if model == "Lasso": tmp_beta = self.Lasso_regression(tmp_X_train, tmp_z_train,lamb)
-            
-            tmp_z_model = self.predict(X_test, tmp_beta)
-            tmp_z_model_train = self.predict(tmp_X_train, tmp_beta)
-            z_model[:, i] = tmp_z_model
-            z_model_train[:, i] = tmp_z_model_train
-            z_train_matrix[:, i] = tmp_z_train
-            z_test_matrix[:, i] = z_test
+            sum_sq_train = 0
+            for start in chunks:
+                res = z_train[start:start+chunk_size] - X_train[start:start+chunk_size] @ beta
+                sum_sq_train += np.sum(weights[start:start+chunk_size] * res**2)
+            error_train += sum_sq_train / max(np.sum(weights), 1)
             
-        error = np.mean( np.mean((z_test.reshape(-1,1) - z_model)**2, axis=1, keepdims=True) )
-        bias = np.mean( (z_test_matrix - np.mean(z_model, axis=1, keepdims=True))**2 )
-        variance = np.mean( np.var(z_model, axis=1, keepdims=True) )
-        error_train = np.mean( np.mean((z_train_matrix - z_model_train)**2, axis=1, keepdims=True) )
-
+            z_model = np.concatenate([X_test[start:start+chunk_size] @ beta 
+                                      for start in test_chunks])
+            sum_sq_error += np.sum((z_test - z_model)**2)
+            count, mean, M2 = self._welford_update(count, mean, M2, z_model[:, None])
+        
+        error = sum_sq_error / (bootstrap_nr*len(z_test))
+        bias = np.mean( (z_test - mean)**2 )
+        variance = np.mean( M2/count )
+        error_train = error_train / bootstrap_nr
         return error, bias, variance, error_train
+    
+    def _welford_update(self, count, mean, M2, values):
+        '''
+        Online mean and sum of squared deviations (Welford, combined with a 
+        batch as in Chan et al.). 
+        Args: 
+            count (int): number of values seen so far
+            mean (1d array): running mean per point
+            M2 (1d array): running sum of squared deviations per point
+            values (2d array): new values, one column per replicate
+        Return: 
+            count, mean, M2 updated with the new values; the variance is 
+            M2/count
+        '''
+        k = values.shape[1]
+        batch_mean = np.mean(values, axis=1)
+        batch_M2 = np.sum((values - batch_mean[:, None])**2, axis=1)
+        delta = batch_mean - mean
+        total = count + k
+        mean = mean + delta*k/total
+        M2 = M2 + batch_M2 + delta**2*count*k/total
+        return total, mean, M2
+    
+    def _bootstrap_betas(self, X, z, weights, lamb=0):
+        '''
+        OLS/Ridge parameters for many row weightings of the same data. The 
+        weighted Gram matrices X^T diag(w_b) X are built with one stacked 
+        matmul per fixed-size batch of resamples, so the temporary memory 
+        does not grow with bootstrap_nr. If the Gram matrix of all rows 
+        (plus the smallest lambda) has a condition estimate below 1e10, the 
+        batch is solved with one stacked np.linalg.solve per lambda. 
+        Otherwise beta is pinv(X_b.T @ X_b + A) X_b^T z_b from one stacked 
+        np.linalg.pinv per lambda, as in the loop over resamples. All-zero 
+        columns get beta = 0, as in _solve().
+        Args: 
+            X (2d array): design matrix, shape (n, p)
+            z (1d array): z vector
+            weights (2d array): row weights, shape (bootstrap_nr, n)
+            lamb (float or 1d array): value of lambda, 0 for OLS. For an 
+                array the Gram matrices are built once for all lambdas
+        Return: 
+            betas (2d or 3d array): regression parameters, shape 
+                (p, bootstrap_nr), or (p, bootstrap_nr, len(lamb)) if lamb is 
+                an array
+        '''
+        lambs = np.atleast_1d(lamb).astype(float)
+        live = np.any(X != 0, axis=0)
+        X = X[:, live]
+        p = X.shape[1]
+        b = (weights * z) @ X
+        betas = np.zeros((len(live), len(weights), len(lambs)))
+        
+        # the resamples are about as well conditioned as the full data
+        G = X.T @ X + lambs.min()*np.eye(p)
+        try:
+            cond = self._cond_cholesky(G, np.linalg.cholesky(G))
+        except np.linalg.LinAlgError:
+            cond = np.inf
+        
+        batch = max(1, 2**22 // (p*max(p, len(z))))
+        for start in range(0, len(weights), batch):
+            w, b_w = weights[start:start+batch], b[start:start+batch, :, None]
+            G_w = (X.T[None] * w[:, None, :]) @ X
+            if cond <= 1e10:
+                try:
+                    for k, lamb_k in enumerate(lambs):
+                        beta = np.linalg.solve(G_w + lamb_k*np.eye(p), b_w)
+                        betas[live, start:start+batch, k] = beta[:, :, 0].T
+                    continue
+                except np.linalg.LinAlgError:
+                    pass
+            
+            # same solution and cutoff as the loop over resamples
+            for k, lamb_k in enumerate(lambs):
+                beta = np.linalg.pinv(G_w + lamb_k*np.eye(p)) @ b_w
+                betas[live, start:start+batch, k] = beta[:, :, 0].T
+        return betas if np.ndim(lamb) else betas[:, :, 0]
 
 
     def kfold(self, X, z, k=5, model="OLS", lamb=0):
         """
-        Cross-validation 
+        Cross-validation. For OLS and Ridge X^T X and X^T z are computed 
+        once for all the data and once for each fold, and the train system 
+        of fold i is the full Gram matrix minus the Gram matrix of fold i. 
+        Each train Gram matrix is diagonalized once, so a whole vector of 
+        lambdas costs little more than one. The subtraction cancels digits, 
+        so when the full Gram matrix (plus the smallest lambda) has a 
+        condition estimate above 1e10, the folds are fitted from QR factors 
+        of [X z] instead: the R factor of the train rows of fold i is the 
+        R factor of the stacked R factors of the other folds, and its SVD 
+        gives the pinv solution without squaring the condition number. 
+        Lasso is always refitted on the concatenated folds.
         Args: 
             X (2d array): design matrix
             z (1d array): z-vector
             k (int): number of folds to divide data into
             model (str): Regression model used. 'OLS', 'Ridge', or 'Lasso' 
             Defaults to OLS. 
-            lamb (float): value of lambda for Ridge and Lasso regressions
+            lamb (float or 1d array): value of lambda for Ridge and Lasso 
+                regressions. Ridge also takes an array of lambdas.
             
         Returns: 
-            z_train (list[1d array]): List of arrays of len(z_train). The list 
-                has length = bootstrap_nr
-            z_model ((list[1d array]): List of len=bootstrap_nr of arrays of 
-                     len(z_train)
-            z_model ((list[1d array]): List of len=bootstrap_nr of arrays of 
-                     len(z_test)
+            MSE (float or 1d array): mean test MSE over the folds (one per 
+                lambda if lamb is an array)
+            MSE_train (float or 1d array): mean train MSE over the folds
         """
         
         # shuffle X and z together (so that they still match)
@@ -365,31 +1790,244 @@ class LinearRegression():
         # split into k vectors
         X_folds = np.array_split(X, k)
         z_folds = np.array_split(z, k)
-
-        MSE_v = []
-        MSE_train_v = []        
-
-        for i in range(k):
-            # test vectors are fold index i, train vectors the rest
-            tmp_X_test = X_folds[i]
-            tmp_z_test = z_folds[i]
-            tmp_X_train = np.concatenate(X_folds[:i] + X_folds[i+1:])
-            tmp_z_train = np.concatenate(z_folds[:i] + z_folds[i+1:])
-            
-            # regression
-            if model == "OLS": tmp_beta = self.OLS(tmp_X_train, tmp_z_train)
-            if model == "Ridge": tmp_beta = self.Ridge_regression(tmp_X_train, tmp_z_train,lamb)
-            if model == "Lasso": tmp_beta = self.Lasso_regression(tmp_X_train, tmp_z_train,lamb)
+        
+        if model == "Lasso":
+            MSE_v = []
+            MSE_train_v = []        
+    
+            for i in range(k):
+                # test vectors are fold index i, train vectors the rest
+                tmp_X_test = X_folds[i]
+                tmp_z_test = z_folds[i]
+                tmp_X_train = np.concatenate(X_folds[:i] + X_folds[i+1:])
+                tmp_z_train = np.concatenate(z_folds[:i] + z_folds[i+1:])
+                
+                # regression
+                tmp_beta, tmp_intercept = self.Lasso_regression(tmp_X_train, tmp_z_train,lamb)
+                
+                # predict
+                tmp_z_model = self.predict(tmp_X_test, tmp_beta, tmp_intercept)
+                tmp_z_model_train = self.predict(tmp_X_train, tmp_beta, tmp_intercept)
+                
+                MSE_v.append( self.MSE(tmp_z_test, tmp_z_model))
+                MSE_train_v.append( self.MSE(tmp_z_train, tmp_z_model_train))            
             
-            # predict
-            tmp_z_model = self.predict(tmp_X_test, tmp_beta)
-            tmp_z_model_train = self.predict(tmp_X_train, tmp_beta)
+            return np.mean(MSE_v), np.mean(MSE_train_v) 
+        
+        lambs = np.atleast_1d(lamb).astype(float)
+        if model == "OLS": lambs = np.zeros(1)
+        # zero columns (the centered intercept) play no part in the fits
+        live = np.flatnonzero(np.any(X != 0, axis=0))
+        X_folds = [X_i[:, live] for X_i in X_folds]
+        X = X[:, live]
+        p = len(live)
+        G = X.T @ X
+        
+        # the downdate G - X_i^T X_i is only used when the full Gram matrix 
+        # is well conditioned, otherwise the folds are fitted from R factors
+        G_lamb = G + lambs.min()*np.eye(p)
+        try:
+            cond = self._cond_cholesky(G_lamb, np.linalg.cholesky(G_lamb))
+        except np.linalg.LinAlgError:
+            cond = np.inf
+        if cond > 1e10:
+            # R factor of [X_j z_j] for every fold (or the rows themselves if 
+            # the fold has no more than p+1 rows). The train rows of fold i 
+            # have the same R factor as the stacked R_j with j != i, so each 
+            # fold is a QR of at most (k-1)(p+1) rows, and X^T X is never 
+            # formed.
+            R_folds = [np.column_stack((X_i, z_i)) for X_i, z_i in zip(X_folds, z_folds)]
+            R_folds = [np.linalg.qr(R_j, mode='r') if len(R_j) > p+1 else R_j 
+                       for R_j in R_folds]
+        
+        b = X.T @ z
+        zz = z @ z
+        MSE_v = np.zeros(len(lambs))
+        MSE_train_v = np.zeros(len(lambs))
+        for i in range(k):
+            n_train = len(z) - len(z_folds[i])
+            if cond > 1e10:
+                R = np.linalg.qr(np.concatenate(R_folds[:i] + R_folds[i+1:]), mode='r')
+                # |z - X beta|^2 = |r - R_X beta|^2 + |rest of the last column|^2
+                R_X, r, rho_sq = R[:p, :p], R[:p, p], np.sum(R[p:, p]**2)
+                U, s, Vt = np.linalg.svd(R_X, full_matrices=False)
+                betas = Vt.T @ (self._ridge_filter(s, lambs) * (U.T @ r)[:, None])
+                sum_sq_train = np.sum((r[:, None] - R_X @ betas)**2, axis=0) + rho_sq
+            else:
+                # train system = all data minus fold i
+                G_train = G - X_folds[i].T @ X_folds[i]
+                b_train = b - X_folds[i].T @ z_folds[i]
+                zz_train = zz - z_folds[i] @ z_folds[i]
+                
+                # pinv(G_train + lamb*I) for all lambdas from one eigendecomposition
+                eigvals, Q = np.linalg.eigh(G_train)
+                denom = eigvals[:, None] + lambs[None, :]
+                keep = np.abs(denom) > 1e-15 * np.abs(denom).max(axis=0)
+                inv = np.where(keep, 1 / np.where(keep, denom, 1), 0)
+                betas = Q @ (inv * (Q.T @ b_train)[:, None])
+                # |z - X beta|^2 over the train rows, from the train Gram matrix
+                sum_sq_train = zz_train - 2*betas.T @ b_train \
+                               + np.sum(betas * (G_train @ betas), axis=0)
             
-            MSE_v.append( self.MSE(tmp_z_test, tmp_z_model))
-            MSE_train_v.append( self.MSE(tmp_z_train, tmp_z_model_train))            
+            tmp_z_model = X_folds[i] @ betas
+            MSE_v += np.mean((z_folds[i][:, None] - tmp_z_model)**2, axis=0)
+            MSE_train_v += sum_sq_train / n_train
         
-        return np.mean(MSE_v), np.mean(MSE_train_v) 
+        MSE_v, MSE_train_v = MSE_v/k, MSE_train_v/k
+        if np.ndim(lamb) == 0 or model == "OLS":
+            return MSE_v[0], MSE_train_v[0]
+        return MSE_v, MSE_train_v
+    
+
+class RegressionResult():
+    '''
+    Result of an OLS or Ridge fit (made by LinearRegression.fit). The thin 
+    SVD X = U diag(s) V^T is computed once, and everything else is a lazy, 
+    cached property derived from it:
+        beta = V diag(d) U^T z, with the filter d = s/(s^2 + lamb) (same 
+            cutoff as pinv, so lamb=0 is the OLS solution)
+        cov_beta = sigma^2 V diag(d^2) V^T, which is sigma^2 (X^T X)^-1 for 
+            OLS and sigma^2 (X^T X + lamb I)^-1 X^T X (X^T X + lamb I)^-1 
+            for Ridge
+        hat_diag = diagonal of U diag(s^2/(s^2 + lamb)) U^T
+    Args:
+        reg (LinearRegression): model that made the fit (for MSE, R2 and 
+            the pinv cutoff)
+        X (2d array): design matrix
+        z (1d array): z vector
+        lamb (float): lambda value, 0 for OLS
+        sigma_sq (float): noise variance, estimated from the residuals as 
+            RSS/(n - effective number of parameters) if None
+    '''
+    def __init__(self, reg, X, z, lamb=0, sigma_sq=None):
+        self.reg = reg
+        self.X = X
+        self.z = z
+        self.lamb = lamb
+        self._sigma_sq = sigma_sq
+        self.U, self.s, self.Vt = np.linalg.svd(X, full_matrices=False)
+    
+    @cached_property
+    def filter(self):
+        return self.reg._ridge_filter(self.s, np.array([float(self.lamb)]))[:, 0]
+    
+    @cached_property
+    def beta(self):
+        return self.Vt.T @ (self.filter * (self.U.T @ self.z))
+    
+    @cached_property
+    def z_model(self):
+        return self.reg.predict(self.X, self.beta)
+    
+    @cached_property
+    def residuals(self):
+        return self.z - self.z_model
+    
+    @cached_property
+    def mse(self):
+        return self.reg.MSE(self.z, self.z_model)
+    
+    @cached_property
+    def r2(self):
+        return self.reg.R2(self.z, self.z_model)
+    
+    @cached_property
+    def dof(self):
+        '''Effective number of parameters, the trace of the hat matrix'''
+        return np.sum(self.s * self.filter)
+    
+    @cached_property
+    def sigma_sq(self):
+        if self._sigma_sq is not None:
+            return self._sigma_sq
+        return np.sum(self.residuals**2)/(len(self.z) - self.dof)
+    
+    @cached_property
+    def cov_beta(self):
+        return self.sigma_sq * (self.Vt.T * self.filter**2) @ self.Vt
+    
+    @cached_property
+    def beta_variance(self):
+        return self.sigma_sq * np.sum((self.Vt.T * self.filter)**2, axis=1)
     
+    @cached_property
+    def conf_interval(self):
+        '''95% confidence interval of beta, (lower, upper)'''
+        half_width = 1.96*np.sqrt(self.beta_variance)
+        return self.beta - half_width, self.beta + half_width
+    
+    @cached_property
+    def hat_diag(self):
+        return np.sum(self.U**2 * (self.s * self.filter), axis=1)
+    
+
+class RandomFourierRegression(LinearRegression):
+    '''
+    Regression on random Fourier features instead of polynomials: the 
+    columns of the design matrix are sqrt(2/D) cos(w_k . (x, y) + b_k), 
+    k = 1..D, with w_k ~ N(0, 2 gamma I) and b_k ~ U(0, 2 pi), plus a constant 
+    column (the intercept, zero after centering like the polynomial one). 
+    X X^T approximates the RBF kernel matrix exp(-gamma |r - r'|^2), so Ridge 
+    on these features approximates kernel ridge regression, at O(n D^2) with 
+    the same solvers, and D sets the accuracy/cost tradeoff. Everything that 
+    only uses the design matrix (split, OLS, Ridge, Lasso, bootstrap, kfold, 
+    the paths) is inherited. The polynomial specific methods (fit_grid, 
+    gram_matrix, degree_sweep, to_monomial) do not apply.
+    Args:
+        x, y, z_data, split, test_size, model, seed, lamb, plot, solver, tol:
+            as in LinearRegression
+        n_features (int): number D of random features
+        gamma (float): inverse squared length scale of the RBF kernel, in 
+            the units of x and y
+    '''
+    def __init__(self, x, y, z_data, n_features = 200, gamma = 10, split = False, 
+                 test_size = 0.3, model = 'Ridge', seed = 42, lamb = 1e-6, 
+                 plot = False, solver = 'auto', tol = None):
+        
+        self.n_features = n_features
+        self.gamma = gamma
+        rng = np.random.default_rng(seed)
+        self.W = rng.normal(0, np.sqrt(2*gamma), (2, n_features))
+        self.b = rng.uniform(0, 2*np.pi, n_features)
+        super().__init__(x, y, z_data, degree = 0, split = split, 
+                         test_size = test_size, model = model, seed = seed, 
+                         lamb = lamb, plot = plot, solver = solver, 
+                         basis = 'fourier', tol = tol)
+    
+    def design_matrix(self, x, y, order='F'):
+        '''
+        Creates the design matrix of random Fourier features
+        Args:
+            x (1d array): x-coordinates 
+            y (1d array): y-coordinates
+            order (str): memory layout of X, 'F' or 'C'
+        Returns: 
+            X (2d array): design matrix, shape (len(x), n_features + 1)
+        '''
+        x = np.asarray(x, dtype=float)
+        shape = x.shape
+        X = np.empty((x.size, self.n_features +1), order=order)
+        X[:, 0] = 1
+        np.multiply.outer(x.ravel(), self.W[0], out=X[:, 1:])
+        X[:, 1:] += np.multiply.outer(np.ravel(y), self.W[1]) + self.b
+        np.cos(X[:, 1:], out=X[:, 1:])
+        X[:, 1:] *= np.sqrt(2/self.n_features)
+        return X.reshape(shape + (self.n_features +1,)).squeeze()
+    
+    def n_columns(self):
+        return self.n_features +1
+    
+    def predict_grid(self, x_axis, y_axis, beta=None, intercept=0):
+        '''
+        Predicts z on the grid np.meshgrid(x_axis, y_axis). The features do 
+        not factor over the axes, so the grid is evaluated in row blocks.
+        '''
+        if beta is None: beta = self.beta
+        x_2d, y_2d = np.meshgrid(x_axis, y_axis)
+        z = [self.predict(X, beta, intercept) for _, X in 
+             self.design_matrix_chunks(x_2d.ravel(), y_2d.ravel())]
+        return np.concatenate(z).reshape(x_2d.shape)
+        
 
 if __name__ == '__main__':
     
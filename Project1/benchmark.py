@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Timing and accuracy comparisons of the faster routines in analysis.py 
+against the straightforward ones. Structured in blocks like plot.py.
+"""
+from analysis import FrankeFunction, LinearRegression
+import numpy as np
+import time
+import warnings
+from sklearn.exceptions import ConvergenceWarning
+warnings.filterwarnings('ignore', category=ConvergenceWarning)
+
+#%% Lasso: path solver vs. one sklearn Lasso per lambda
+np.random.seed(seed=42)
+ff = FrankeFunction(axis_n = 20, noise_var = 0.05, plot=False)
+lambs = np.logspace(-7,0,8)
+
+def lasso_objective(X, z, beta, intercept, lamb):
+    return np.sum((z - X @ beta - intercept)**2)/(2*len(z)) + lamb*np.sum(np.abs(beta))
+
+# gain > 0: the path reaches a lower objective than sklearn at that lambda
+print('degree | time sklearn | time path | min gain of path | max gain of path')
+for degree in [5, 10, 15]:
+    reg = LinearRegression(ff.x, ff.y, ff.z, degree = degree, split=True, model=None)
+    X, z = reg.X_train, reg.z_train
+    
+    start = time.perf_counter()
+    sk_fits = [reg.Lasso_regression(X, z, lamb) for lamb in lambs[::-1]]
+    time_sklearn = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    path_lambs, betas, intercepts = reg.Lasso_path(X, z, lambs)
+    time_path = time.perf_counter() - start
+    
+    gain = [(lasso_objective(X, z, b, i, lamb) - lasso_objective(X, z, betas[:,k], intercepts[k], lamb))
+            / lasso_objective(X, z, b, i, lamb)
+            for k, (lamb, (b, i)) in enumerate(zip(path_lambs, sk_fits))]
+    print('{:6d} | {:12.3f} | {:9.3f} | {:16.2e} | {:.2e}'.format(
+        degree, time_sklearn, time_path, np.min(gain), np.max(gain)))
+
+#%% Design matrix: recurrence into a preallocated array vs. list of fresh powers
+import tracemalloc
+
+def design_matrix_list(x, y, degree):
+    X = []
+    for y_exp in range(degree +1):
+        for x_exp in range(degree +1):
+            if y_exp + x_exp <= degree:
+                X.append(x**x_exp * y**y_exp)
+    return (np.array(X).T).squeeze()
+
+def time_and_peak(build, repeats=3):
+    tracemalloc.start()
+    build()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for i in range(repeats): build()
+    return (time.perf_counter() - start)/repeats, peak/1e6
+
+ff = FrankeFunction(axis_n = 60, noise_var = 0.05, plot=False)
+print('degree | time list | time prealloc | peak MB list | peak MB prealloc')
+for degree in [5, 10, 20, 30, 50]:
+    reg = LinearRegression(ff.x, ff.y, ff.z, degree = degree, model=None)
+    t_list, m_list = time_and_peak(lambda: design_matrix_list(ff.x, ff.y, degree))
+    t_new, m_new = time_and_peak(lambda: reg.design_matrix(ff.x, ff.y))
+    print('{:6d} | {:9.4f} | {:13.4f} | {:12.1f} | {:16.1f}'.format(
+        degree, t_list, t_new, m_list, m_new))
+
+#%% Normal equations: X^T X from power-sum moments vs. from the design matrix
+rng = np.random.default_rng(42)
+x, y = rng.random(10000), rng.random(10000)
+z = rng.normal(0, 1, 10000)
+
+print('degree | time X^T X | time moments | relative difference')
+for degree in [5, 10, 20, 30, 50]:
+    reg = LinearRegression(x, y, z, degree = degree, model=None)
+    start = time.perf_counter()
+    X = reg.design_matrix(x, y)
+    XtX = X.T @ X
+    t_matrix = time.perf_counter() - start
+    start = time.perf_counter()
+    XtX_moments, _ = reg.gram_matrix(x, y, z)
+    t_moments = time.perf_counter() - start
+    print('{:6d} | {:10.4f} | {:12.4f} | {:.1e}'.format(
+        degree, t_matrix, t_moments, 
+        np.linalg.norm(XtX_moments - XtX)/np.linalg.norm(XtX)))
+
+#%% Tiled terrain regression: throughput against the number of processes
+import os
+from terrain import fit_tiles
+rng = np.random.default_rng(42)
+rows, cols = np.mgrid[0:1800, 0:1800]
+terrain = 1000 + 300*np.sin(cols/60)*np.cos(rows/80) + 100*np.sin(cols/13 + rows/17) \
+          + rng.normal(0, 5, rows.shape)
+
+print('processes | time | tiles per second | speed-up')
+for n_workers in sorted({1, 2, 4, os.cpu_count()}):
+    start = time.perf_counter()
+    _, tile_mse, _ = fit_tiles(terrain, tile_size=128, overlap=16, 
+                               degrees=range(2,16), n_workers=n_workers)
+    elapsed = time.perf_counter() - start
+    if n_workers == 1: time_serial = elapsed
+    print('{:9d} | {:4.1f} | {:16.1f} | {:8.2f}'.format(
+        n_workers, elapsed, tile_mse.size/elapsed, time_serial/elapsed))
+
+#%% Randomized least squares: sketch-and-solve and blendenpik vs. the exact solvers
+np.random.seed(seed=42)
+ff = FrankeFunction(axis_n = 400, noise_var = 0.05, plot=False)
+rng = np.random.default_rng(42)
+rows, cols = np.mgrid[0:1000, 0:1000]/1000
+terrain = 1000 + 300*np.sin(6*cols)*np.cos(5*rows) + 100*np.sin(70*cols + 60*rows) \
+          + rng.normal(0, 5, rows.shape)
+x_t, y_t = np.meshgrid(np.linspace(0,1,1000), np.linspace(0,1,1000))
+datasets = [('Franke', ff.x, ff.y, ff.z, 15), 
+            ('terrain', x_t.ravel(), y_t.ravel(), terrain.ravel(), 12)]
+
+print('data    | solver     | time  | residual / exact residual - 1 | relative beta error')
+for name, x, y, z, degree in datasets:
+    reg = LinearRegression(x, y, z, degree = degree, model=None, basis='legendre')
+    reg.solver = 'svd'
+    beta_exact = reg.OLS(reg.X, z)
+    res_exact = np.linalg.norm(z - reg.X @ beta_exact)
+    for solver in ['cholesky', 'qr', 'svd', 'sketch', 'blendenpik']:
+        reg.solver = solver
+        start = time.perf_counter()
+        beta = reg.OLS(reg.X, z)
+        elapsed = time.perf_counter() - start
+        print('{:7s} | {:10s} | {:5.2f} | {:29.1e} | {:.1e}'.format(
+            name, solver, elapsed, np.linalg.norm(z - reg.X @ beta)/res_exact - 1,
+            np.linalg.norm(beta - beta_exact)/np.linalg.norm(beta_exact)))
+
+#%% Terrain: coarse-to-fine levels vs. one global polynomial, MSE against CPU time
+from terrain import fit_multires
+rng = np.random.default_rng(42)
+rows, cols = np.mgrid[0:1800, 0:1200]
+terrain = 1000 + 300*np.sin(cols/160)*np.cos(rows/180) + 100*np.sin(cols/23 + rows/37) \
+          + 30*np.sin(cols/5)*np.cos(rows/7) + rng.normal(0, 5, rows.shape)
+
+print('model                          | MSE     | CPU time')
+for degree in [10, 20, 40, 60]:
+    start = time.process_time()
+    reg = LinearRegression(np.linspace(0,1,1200), np.linspace(0,1,1800), terrain, 
+                           degree = degree, basis='legendre', grid=True)
+    print('global, degree {:2d}              | {:7.1f} | {:.3f}'.format(
+        degree, np.mean((reg.z_model - terrain)**2), time.process_time() - start))
+_, report = fit_multires(terrain)
+for factor, degree, tile_size, mse, cost in report:
+    print('level: factor {:2d}, deg {:2d}, tile {!s:4s} | {:7.1f} | {:.3f}'.format(
+        factor, degree, tile_size, mse, cost))
+
+#%% Sparse terrain model: OMP over the degree 50 columns vs. the full degree 50 fit
+rng = np.random.default_rng(42)
+rows, cols = np.mgrid[0:100, 0:100]/100
+terrain = 1000 + 300*np.sin(6*cols)*np.cos(5*rows) + 100*np.sin(20*cols + 15*rows) \
+          + rng.normal(0, 5, rows.shape)
+x_t, y_t = np.meshgrid(np.linspace(0,1,100), np.linspace(0,1,100))
+np.random.seed(42)
+reg = LinearRegression(x_t.ravel(), y_t.ravel(), terrain.ravel(), degree = 50, 
+                       split=True, model=None, basis='legendre')
+
+print('model           | terms | time  | test MSE')
+start = time.perf_counter()
+beta = reg.OLS(reg.X_train, reg.z_train)
+print('full degree 50  | {:5d} | {:5.2f} | {:.1f}'.format(
+    reg.X.shape[1], time.perf_counter() - start, reg.MSE(reg.z_test, reg.X_test @ beta)))
+for criterion in ['bic', 'cv']:
+    start = time.perf_counter()
+    selected, betas, error, _, _, best = reg.omp_path(reg.X_train, reg.X_test, reg.z_train, 
+                                                      reg.z_test, criterion=criterion)
+    print('OMP, {:4s}       | {:5d} | {:5.2f} | {:.1f}'.format(
+        criterion, best +1, time.perf_counter() - start, error[best]))
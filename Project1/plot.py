@@ -4,9 +4,10 @@ Created on Tue Sep 28 21:58:52 2021
 
 @author: lidia
 """
-from analysis import FrankeFunction, LinearRegression
+from analysis import FrankeFunction, LinearRegression, RandomFourierRegression
 import matplotlib.pyplot as plt
 import numpy as np
+import time
 
 #Get dir for saving plots
 from os.path import dirname, abspath, join
@@ -20,19 +21,26 @@ def plot_conf_interval(data,model='OLS',lamb=0,noise_var=0.05,axis_n=10,degree=5
     Plot betas with confidence intervals. Get MSE and R2
     '''
     np.random.seed(seed=42)
-    reg = LinearRegression(data[0], data[1], data[2], degree = degree, split=False,
-                           model=model,lamb=lamb)
-    beta_var = reg.beta_variance(reg.X, sigma_sq = noise_var)
+    if model == 'Lasso':
+        reg = LinearRegression(data[0], data[1], data[2], degree = degree, split=False,
+                               model=model,lamb=lamb)
+        beta, beta_var = reg.beta, reg.beta_variance(reg.X, sigma_sq = noise_var)
+        MSE = reg.MSE(reg.z_data, reg.z_model)
+        R2 = reg.R2(reg.z_data, reg.z_model)
+    else:
+        # One factorization for beta, its variance and the scores
+        reg = LinearRegression(data[0], data[1], data[2], degree = degree, split=False,
+                               model=None,lamb=lamb)
+        result = reg.fit(reg.X, reg.z_data, model=model, lamb=lamb, sigma_sq=noise_var)
+        beta, beta_var = result.beta, result.beta_variance
+        MSE, R2 = result.mse, result.r2
     x = list(range(0, len(beta_var)))
     beta_conf = 1.96*np.sqrt(beta_var/axis_n**2)
     
-    MSE = reg.MSE(reg.z_data, reg.z_model)
-    R2 = reg.R2(reg.z_data, reg.z_model)
-    
-    plt.errorbar(x, reg.beta, yerr=beta_conf, markersize=4, linewidth=1, \
+    plt.errorbar(x, beta, yerr=beta_conf, markersize=4, linewidth=1, \
                  ecolor="black", fmt='o', capsize=5, capthick=1)
     plt.title("Regression parameters")
-    x_labels = [r"$\beta_"+"{{{:}}}$".format(i) for i in range(len(reg.beta))]
+    x_labels = [r"$\beta_"+"{{{:}}}$".format(i) for i in range(len(beta))]
     plt.xticks(x, x_labels)
     plt.show()
     
@@ -49,26 +57,57 @@ def plot_conf_interval(data,model='OLS',lamb=0,noise_var=0.05,axis_n=10,degree=5
     
 
 def plot_train_test_MSE(data,model='OLS',lamb=0, max_degree=9, axis_n = 1, bootstrap_nr = 100, 
-                        noise_var = 'unknown', save = False):
+                        noise_var = 'unknown', save = False, adaptive = False, patience = 3,
+                        stride = 1):
     '''
     Exercice 2
     Plot test and train MSE. For "nice" plot, axis_n=50, noise_var=0.05, 
     # deg range(1,9)
+    With adaptive=True the degrees are scored with LinearRegression.adaptive_sweep 
+    (stop when the test MSE has not improved for patience degrees, first pass 
+    every stride-th degree, then bisection), and only the scored degrees are drawn.
     '''
     np.random.seed(seed=42)
     trainMSE = []
     testMSE = []
     x = []
-    for deg in range(1,max_degree):
-        x.append(deg)
-        reg = LinearRegression(data[0], data[1], data[2], degree = deg, split=True,
-                           model=model,lamb=lamb)
-
-        trainMSE.append( reg.MSE(reg.z_train, reg.z_model_train))
-        testMSE.append( reg.MSE(reg.z_test, reg.z_model))
-        
-    plt.plot(x, testMSE, 'b') 
-    plt.plot(x, trainMSE, 'r') 
+    if adaptive:
+        x = list(range(1,max_degree))
+        reg = _max_degree_reg(data, max_degree, lamb)
+        def score(deg):
+            cols = reg.degree_columns(deg)
+            X_train, X_test = reg.X_train[:, cols], reg.X_test[:, cols]
+            intercept = 0
+            if model == 'Lasso':
+                beta, intercept = reg.Lasso_regression(X_train, reg.z_train, lamb)
+            elif model == 'Ridge':
+                beta = reg.Ridge_regression(X_train, reg.z_train, lamb)
+            else:
+                beta = reg.OLS(X_train, reg.z_train)
+            return (reg.MSE(reg.z_test, reg.predict(X_test, beta, intercept)), 
+                    reg.MSE(reg.z_train, reg.predict(X_train, beta, intercept)))
+        scores, _ = _sweep(reg, score, x, adaptive, patience, stride)
+        testMSE, trainMSE = scores.T
+    elif model in ('OLS', 'Ridge'):
+        # degree_sweep factorizes the Gram matrix of the highest degree once
+        x = list(range(1,max_degree))
+        reg = _max_degree_reg(data, max_degree, lamb)
+        _, testMSE, trainMSE = reg.degree_sweep(reg.X_train, reg.X_test, 
+                                                reg.z_train, reg.z_test, 
+                                                degrees=x, model=model)
+    else:
+        for deg in range(1,max_degree):
+            x.append(deg)
+            reg = LinearRegression(data[0], data[1], data[2], degree = deg, split=True,
+                               model=model,lamb=lamb)
+    
+            trainMSE.append( reg.MSE(reg.z_train, reg.z_model_train))
+            testMSE.append( reg.MSE(reg.z_test, reg.z_model))
+    
+    # skipped degrees of the adaptive sweep are NaN
+    shown = ~np.isnan(testMSE)
+    plt.plot(np.array(x)[shown], np.array(testMSE)[shown], 'b') 
+    plt.plot(np.array(x)[shown], np.array(trainMSE)[shown], 'r') 
     plt.legend(["Test MSE", "Train MSE"])
     plt.title("Model MSE")
     plt.xlabel("Model complexity (degree)")
@@ -82,27 +121,64 @@ def plot_train_test_MSE(data,model='OLS',lamb=0, max_degree=9, axis_n = 1, boots
             plt.savefig(join(plots_dir, model+'_'+'MSEtest_train-n={}-noise={}.pdf'.format(axis_n**2, noise_var)))
             
     
+def _max_degree_reg(data, max_degree, lamb=0, split=True):
+    '''
+    LinearRegression with only the design matrix of degree max_degree-1, the 
+    highest degree of a sweep (split in train and test if split=True).
+    '''
+    # Lower degrees are column subsets of the highest degree design matrix, 
+    # see LinearRegression.degree_columns
+    return LinearRegression(data[0], data[1], data[2], degree = max_degree-1, 
+                            split=split, model=None, lamb=lamb)
+    
+def _sweep(reg, score, degrees, adaptive, patience, stride):
+    '''
+    score(deg) for every degree, or only for the degrees picked by 
+    reg.adaptive_sweep. Returns the scores (NaN where skipped) and a mask of 
+    the scored degrees.
+    '''
+    if not adaptive:
+        return np.array([score(deg) for deg in degrees]), np.ones(len(degrees), dtype=bool)
+    scores, scored, saved = reg.adaptive_sweep(score, degrees, patience=patience, stride=stride)
+    print("Adaptive sweep: {} of {} degrees fitted, {:.0%} of the work saved".format(
+        np.count_nonzero(scored), len(degrees), saved))
+    return scores, scored
+    
+def _bootstrap(reg, cols, model, lamb, bootstrap_nr, tol):
+    '''
+    Bootstrap of the columns cols of the split design matrix of reg, with a 
+    fixed number of resamples, or with bootstrap_adaptive if tol is given.
+    '''
+    args = (reg.X_train[:, cols], reg.X_test[:, cols], reg.z_train, reg.z_test)
+    if tol is None:
+        return reg.bootstrap(*args, bootstrap_nr=bootstrap_nr, model=model, lamb=lamb)
+    MSE_, bias_, var_, MSE_train_, nr = reg.bootstrap_adaptive(*args, tol=tol, max_nr=bootstrap_nr,
+                                                              model=model, lamb=lamb)
+    print("Degree {}: {} resamples".format(reg.exponents()[0][cols].max(), nr))
+    return MSE_, bias_, var_, MSE_train_
+    
 def plot_bias_var_bootstrap(data,model='OLS',lamb=0,bootstrap_nr=100,max_degree=9,axis_n = 1,
-                            noise_var = 'unknown', save = False, legend = True):
+                            noise_var = 'unknown', save = False, legend = True,
+                            adaptive = False, patience = 3, stride = 1, tol = None):
     '''
     Plot the mean of the bias, variance and MSE over samples of the data for 
     The sampling is done using the bootstrap method. 
+    adaptive, patience, stride: see plot_train_test_MSE
+    tol: if given, each degree uses LinearRegression.bootstrap_adaptive with 
+        this relative tolerance, and bootstrap_nr is the largest number of 
+        resamples
     '''
     np.random.seed(seed=42)
-    MSE, bias, var, bias_plus_var = [],[],[],[]
-    x = []
+    reg2 = _max_degree_reg(data, max_degree, lamb)
     
-    for deg in range(1,max_degree):
-        x.append(str(deg))  # make xaxis ticks integers
-        reg2 = LinearRegression(data[0], data[1], data[2], degree = deg, split=True,
-                           model=model,lamb=lamb,test_size = 0.3)
-        MSE_, bias_, var_, _ = reg2.bootstrap(reg2.X_train, reg2.X_test, 
-                                          reg2.z_train, reg2.z_test,model=model,
-                                          bootstrap_nr=bootstrap_nr,lamb=lamb)
-        MSE.append(MSE_)
-        bias.append(bias_)
-        var.append(var_) 
-        bias_plus_var.append(bias_ + var_)
+    def score(deg):
+        cols = reg2.degree_columns(deg)
+        MSE_, bias_, var_, _ = _bootstrap(reg2, cols, model, lamb, bootstrap_nr, tol)
+        return MSE_, bias_, var_
+    degrees = list(range(1,max_degree))
+    scores, scored = _sweep(reg2, score, degrees, adaptive, patience, stride)
+    x = [str(deg) for deg in np.array(degrees)[scored]]  # make xaxis ticks integers
+    MSE, bias, var = scores[scored].T
     
     plt.plot(x, MSE, 'b') 
     plt.plot(x, bias, 'r') 
@@ -119,24 +195,25 @@ def plot_bias_var_bootstrap(data,model='OLS',lamb=0,bootstrap_nr=100,max_degree=
             plt.savefig(join(plots_dir, model+'_'+'biasvar-n={}-noise={}.pdf'.format(axis_n**2, noise_var)))
      
 def plot_mse_bootstrap(data,model='OLS',lamb=0,bootstrap_nr=100,max_degree=9,axis_n = 1,
-                            noise_var = 'unknown', save = False):
+                            noise_var = 'unknown', save = False, adaptive = False, 
+                            patience = 3, stride = 1, tol = None):
     '''
     Plot the test and train MSE over samples of the data for bootstrap sampling
     The sampling is done using the bootstrap method. 
+    adaptive, patience, stride: see plot_train_test_MSE
+    tol: see plot_bias_var_bootstrap
     '''
     np.random.seed(seed=42)
-    MSE, MSE_train = [],[]
-    x = []
+    reg2 = _max_degree_reg(data, max_degree, lamb)
     
-    for deg in range(1,max_degree):
-        x.append(str(deg))  # make xaxis ticks integers
-        reg2 = LinearRegression(data[0], data[1], data[2], degree = deg, split=True,
-                           model=model,lamb=lamb,test_size = 0.3)
-        MSE_, _, _ , MSE_train_ = reg2.bootstrap(reg2.X_train, reg2.X_test, 
-                                          reg2.z_train, reg2.z_test,
-                                          bootstrap_nr=bootstrap_nr,model=model,lamb=lamb)
-        MSE.append(MSE_)
-        MSE_train.append(MSE_train_)
+    def score(deg):
+        cols = reg2.degree_columns(deg)
+        MSE_, _, _ , MSE_train_ = _bootstrap(reg2, cols, model, lamb, bootstrap_nr, tol)
+        return MSE_, MSE_train_
+    degrees = list(range(1,max_degree))
+    scores, scored = _sweep(reg2, score, degrees, adaptive, patience, stride)
+    x = [str(deg) for deg in np.array(degrees)[scored]]  # make xaxis ticks integers
+    MSE, MSE_train = scores[scored].T
 
     plt.plot(x, MSE, 'b') 
     plt.plot(x, MSE_train, 'r') 
@@ -150,19 +227,71 @@ def plot_mse_bootstrap(data,model='OLS',lamb=0,bootstrap_nr=100,max_degree=9,axi
         else:
             plt.savefig(join(plots_dir, model+'_'+'mse_bootstrap-n={}-noise={}.pdf'.format(axis_n**2, noise_var)))
 
+def plot_bias_var_analytic(data, model='OLS', lamb=0, max_degree=9, noise_var=0.05,
+                           validate=False, bootstrap_nr=100, axis_n = 1, save = False,
+                           legend = True):
+    '''
+    Exact bias, variance and expected test MSE over the noise, for Franke 
+    data with known noise (FrankeFunction's noise_var is the standard 
+    deviation, so sigma^2 = noise_var^2). One SVD per degree, no refits. 
+    With validate=True the bootstrap estimates are drawn dashed on top; the 
+    bootstrap "bias" is measured against the noisy test data, so sigma^2 is 
+    subtracted from it to compare.
+    '''
+    np.random.seed(seed=42)
+    sigma_sq = noise_var**2
+    # z and the noise-free Franke function as two targets, so both get the 
+    # same split and centering
+    f = FrankeFunction().franke_function(data[0], data[1])
+    reg2 = _max_degree_reg([data[0], data[1], np.column_stack([data[2], f])], 
+                           max_degree, lamb)
+    z_train, f_train = reg2.z_train.T
+    z_test, f_test = reg2.z_test.T
+    
+    x = list(range(1,max_degree))
+    scores, scores_boot = [], []
+    for deg in x:
+        cols = reg2.degree_columns(deg)
+        scores.append(reg2.bias_variance_analytic(reg2.X_train[:, cols], reg2.X_test[:, cols],
+                                                  f_train, f_test, sigma_sq, model, lamb))
+        if validate:
+            MSE_, bias_, var_, _ = reg2.bootstrap(reg2.X_train[:, cols], reg2.X_test[:, cols],
+                                                  z_train, z_test, model=model,
+                                                  bootstrap_nr=bootstrap_nr, lamb=lamb)
+            scores_boot.append((MSE_, bias_ - sigma_sq, var_))
+    
+    MSE, bias, var = np.array(scores).T
+    plt.plot(x, MSE, 'b')
+    plt.plot(x, bias, 'r')
+    plt.plot(x, var, 'g')
+    labels = ["MSE", "bias", "var"]
+    if validate:
+        MSE_boot, bias_boot, var_boot = np.array(scores_boot).T
+        plt.plot(x, MSE_boot, 'b--')
+        plt.plot(x, bias_boot, 'r--')
+        plt.plot(x, var_boot, 'g--')
+        labels += ["MSE (bootstrap)", "bias (bootstrap)", "var (bootstrap)"]
+    if legend:
+        plt.legend(labels)
+    plt.title("Bias-variance (analytic)")
+    plt.xlabel("Model complexity (degree)")
+    plt.yscale('log')
+    plt.show()
+    if save:
+        plt.savefig(join(plots_dir, model+'_biasvar_analytic-n={}-noise={}.pdf'.format(axis_n**2, noise_var)))
+
 def plot_mse_kfolds(data,model='OLS',lamb=0,kfld=5,max_degree=9, save=False,
                     axis_n = 1, noise_var = 'unknown'):
     np.random.seed(seed=42)
     MSE, MSE_train = [],[]
     x = []
+    reg = _max_degree_reg(data, max_degree, lamb, split=False)
     
     for deg in range(1,max_degree):
         x.append(deg)
-        reg = LinearRegression(data[0], data[1], data[2], degree = deg, split=True,
-                           model=model,lamb=lamb)
-        X_des = reg.design_matrix(x=data[0],y=data[1])
+        X_des = reg.X[:, reg.degree_columns(deg)]
 
-        MSE_, MSE_train_ = reg.kfold(X_des, data[2],k=kfld,model=model)
+        MSE_, MSE_train_ = reg.kfold(X_des, data[2],k=kfld,model=model,lamb=lamb)
         MSE.append(MSE_)
         MSE_train.append(MSE_train_)
 
@@ -178,6 +307,205 @@ def plot_mse_kfolds(data,model='OLS',lamb=0,kfld=5,max_degree=9, save=False,
         else:
             plt.savefig(join(plots_dir, model+'_'+'mse_kfold-n={}-noise={}.pdf'.format(axis_n**2, noise_var)))     
 
+def plot_mse_cost(data, n_features_v=(25,50,100,200,400,800), max_degree=15, gamma=20,
+                  lamb=1e-6, kfld=5, save=False, axis_n = 1, noise_var = 'unknown'):
+    '''
+    k-fold test MSE against fit time, for Ridge on random Fourier features 
+    (one point per number of features D) and on polynomials (one point per 
+    degree), to compare the cost of the two models at the same accuracy.
+    '''
+    np.random.seed(seed=42)
+    time_rff, MSE_rff, time_poly, MSE_poly = [],[],[],[]
+    for n_features in n_features_v:
+        start = time.perf_counter()
+        reg = RandomFourierRegression(data[0], data[1], data[2], n_features = n_features,
+                                      gamma = gamma, model=None, lamb=lamb)
+        MSE_, _ = reg.kfold(reg.X, data[2], k=kfld, model='Ridge', lamb=lamb)
+        time_rff.append(time.perf_counter() - start)
+        MSE_rff.append(MSE_)
+    for deg in range(1,max_degree):
+        start = time.perf_counter()
+        reg = LinearRegression(data[0], data[1], data[2], degree = deg, model=None,
+                               lamb=lamb, basis='legendre')
+        MSE_, _ = reg.kfold(reg.X, data[2], k=kfld, model='Ridge', lamb=lamb)
+        time_poly.append(time.perf_counter() - start)
+        MSE_poly.append(MSE_)
+    
+    plt.loglog(time_rff, MSE_rff, 'bo-')
+    plt.loglog(time_poly, MSE_poly, 'rs-')
+    for n_features, t, m in zip(n_features_v, time_rff, MSE_rff):
+        plt.annotate('D={}'.format(n_features), (t, m))
+    plt.legend(["Random Fourier features", "Polynomial (degree 1-{})".format(max_degree-1)])
+    plt.title("Ridge, MSE (k-folds) against cost")
+    plt.xlabel("Time [s]")
+    plt.ylabel("MSE")
+    plt.show()
+    if save:
+        plt.savefig(join(plots_dir, 'mse_cost-n={}-noise={}.pdf'.format(axis_n**2, noise_var)))
+
+def plot_omp_path(data, degree=30, criterion='bic', max_terms=None, save=False, 
+                  axis_n = 1, noise_var = 'unknown'):
+    '''
+    Test and train MSE along the greedy (OMP) selection path over the 
+    columns of a high degree design matrix, with the model picked by the 
+    criterion marked. Returns the selected columns of that model.
+    '''
+    np.random.seed(seed=42)
+    reg = LinearRegression(data[0], data[1], data[2], degree = degree, split=True, 
+                           model=None, basis='legendre')
+    selected, betas, MSE, MSE_train, ic, best = reg.omp_path(
+        reg.X_train, reg.X_test, reg.z_train, reg.z_test, max_terms=max_terms, 
+        criterion=criterion)
+    x = np.arange(1, len(MSE) +1)
+    
+    plt.plot(x, MSE, 'b')
+    plt.plot(x, MSE_train, 'r')
+    plt.axvline(best +1, color='k', linestyle='--')
+    plt.legend(["Test MSE", "Train MSE", "Selected ({})".format(criterion.upper())])
+    plt.title("OMP path, degree {} ({} columns)".format(degree, reg.X.shape[1]))
+    plt.xlabel("Number of terms")
+    plt.ylabel("MSE")
+    plt.yscale('log')
+    plt.show()
+    if save:
+        plt.savefig(join(plots_dir, 'omp_path-n={}-noise={}.pdf'.format(axis_n**2, noise_var)))
+    return selected[:best +1]
+
+def plot_mse_lambda(data, lambs, model='Ridge', degree=5, save=False, axis_n = 1, 
+                    noise_var = 'unknown'):
+    '''
+    Plot test and train MSE of Ridge or Lasso regression as a function of 
+    lambda. All Ridge lambdas are solved from a single SVD of the train design 
+    matrix, all Lasso lambdas in one warm-started path.
+    '''
+    np.random.seed(seed=42)
+    reg = LinearRegression(data[0], data[1], data[2], degree = degree, split=True,
+                           model=None)
+    if model == 'Ridge':
+        _, _, _, MSE, MSE_train = reg.Ridge_path(reg.X_train, reg.X_test, 
+                                                 reg.z_train, reg.z_test, lambs)
+    elif model == 'Lasso':
+        lambs, betas, intercepts = reg.Lasso_path(reg.X_train, reg.z_train, lambs)
+        MSE = np.mean((reg.z_test.reshape(-1,1) - reg.predict(reg.X_test, betas, intercepts))**2, axis=0)
+        MSE_train = np.mean((reg.z_train.reshape(-1,1) - reg.predict(reg.X_train, betas, intercepts))**2, axis=0)
+    
+    plt.plot(lambs, MSE, 'b') 
+    plt.plot(lambs, MSE_train, 'r') 
+    plt.xscale('log')
+    plt.legend(["Test MSE", "Train MSE"])
+    plt.title("{} MSE (degree {})".format(model, degree))
+    plt.xlabel("$\\lambda$")
+    plt.ylabel("MSE")
+    plt.show()
+    if save:
+        plt.savefig(join(plots_dir, model+'_mse_lambda-n={}-noise={}.pdf'.format(axis_n**2, noise_var)))
+
+def plot_cv_lambda(data, lambs, degree=5, save=False, axis_n = 1, noise_var = 'unknown'):
+    '''
+    Plot exact leave-one-out CV and generalized CV scores of Ridge regression
+    as a function of lambda, computed in closed form (no resampling). 
+    Returns the lambda with the lowest LOOCV score.
+    '''
+    reg = LinearRegression(data[0], data[1], data[2], degree = degree, model=None)
+    loocv, gcv = reg.loocv_gcv(reg.X, data[2], lambs)
+    
+    plt.plot(lambs, loocv, 'b') 
+    plt.plot(lambs, gcv, 'g') 
+    plt.xscale('log')
+    plt.legend(["LOOCV", "GCV"])
+    plt.title("Ridge CV score (degree {})".format(degree))
+    plt.xlabel("$\\lambda$")
+    plt.ylabel("MSE")
+    plt.show()
+    if save:
+        plt.savefig(join(plots_dir, 'Ridge_cv_lambda-n={}-noise={}.pdf'.format(axis_n**2, noise_var)))
+    return lambs[np.argmin(loocv)]
+
+
+def plot_ridge_lambdas(data, lambs, method='MSE', max_degree=10, kfld=5, bootstrap_nr=100, 
+                       ylim=None, log=False):
+    '''
+    Ridge curves over the degree for every lambda in lambs, one subplot per 
+    lambda (2 rows), as plot_train_test_MSE ('MSE'), plot_bias_var_bootstrap 
+    ('bootstrap') or plot_mse_kfolds ('kfolds') would draw them one lambda at 
+    a time, with the same values. All lambdas are fitted together: 
+    degree_sweep shares X^T X of the highest degree, bootstrap the resamples 
+    and their Gram matrices, and kfold the eigendecomposition of each fold.
+    '''
+    np.random.seed(seed=42)
+    reg = _max_degree_reg(data, max_degree, split = method != 'kfolds')
+    x = list(range(1,max_degree))
+    curves = []
+    if method == 'MSE':
+        _, MSE, MSE_train = reg.degree_sweep(reg.X_train, reg.X_test, reg.z_train, 
+                                             reg.z_test, degrees=x, model='Ridge', lamb=lambs)
+        curves = list(zip(MSE, MSE_train))
+    for deg in x:
+        cols = reg.degree_columns(deg)
+        if method == 'bootstrap':
+            MSE_, bias_, var_, _ = reg.bootstrap(reg.X_train[:, cols], reg.X_test[:, cols], 
+                                                 reg.z_train, reg.z_test, model='Ridge',
+                                                 bootstrap_nr=bootstrap_nr, lamb=lambs)
+            curves.append((MSE_, bias_, var_))
+        elif method == 'kfolds':
+            curves.append(reg.kfold(reg.X[:, cols], data[2], k=kfld, model='Ridge', lamb=lambs))
+    curves = np.array(curves)   # (degree, curve, lambda)
+    
+    styles, labels = {'MSE': (['b', 'r'], ["Test MSE", "Train MSE"]),
+                      'bootstrap': (['b', 'r', 'g'], ["MSE", "bias", "var"]),
+                      'kfolds': (['b', 'r'], ["Test MSE", "Train MSE"])}[method]
+    for i, lamb in enumerate(lambs):
+        plt.subplot(2, (len(lambs)+1)//2, i+1)
+        for j, style in enumerate(styles):
+            plt.plot(x, curves[:, j, i], style)
+        plt.legend(labels)
+        plt.title('$\\lambda$='+str(lamb))
+        plt.xlabel("Model complexity (degree)")
+        if ylim is not None: plt.ylim(*ylim)
+        if log: plt.yscale('log')
+    plt.tight_layout()
+    plt.show()
+
+
+def plot_learning_curve(data, model='OLS', lamb=0, degree=5, batch_size=20, test_size=0.3,
+                        save=False, axis_n = 1, noise_var = 'unknown'):
+    '''
+    Test and train MSE as a function of the number of datapoints, in one pass 
+    over the data: the train points are added batch by batch with 
+    partial_fit(), and the model is evaluated after every batch.
+    '''
+    np.random.seed(seed=42)
+    n = len(data[2])
+    idx = np.random.permutation(n)
+    test, train = idx[:int(test_size*n)], idx[int(test_size*n):]
+    reg = LinearRegression(None, None, None, degree = degree, model=None, lamb=lamb,
+                           basis='legendre', domain=((0, 1), (0, 1)))
+    X_test = reg.design_matrix(data[0][test], data[1][test])
+    # running z^T z, X^T z and X^T X of the train points seen so far
+    zz, Xz, XX = 0, 0, 0
+    x, MSE, MSE_train = [], [], []
+    for start in range(0, len(train), batch_size):
+        batch = train[start:start+batch_size]
+        X_batch = reg.design_matrix(data[0][batch], data[1][batch]).reshape(len(batch), -1)
+        zz, Xz, XX = zz + data[2][batch] @ data[2][batch], Xz + X_batch.T @ data[2][batch], \
+                     XX + X_batch.T @ X_batch
+        beta = reg.partial_fit(data[0][batch], data[1][batch], data[2][batch], model=model, lamb=lamb)
+        x.append(start + len(batch))
+        MSE.append(reg.MSE(data[2][test], reg.predict(X_test, beta)))
+        # |z - X beta|^2 = z^T z - 2 beta^T X^T z + beta^T X^T X beta
+        MSE_train.append((zz - 2*beta @ Xz + beta @ XX @ beta)/x[-1])
+    
+    plt.plot(x, MSE, 'b')
+    plt.plot(x, MSE_train, 'r')
+    plt.legend(["Test MSE", "Train MSE"])
+    plt.title("Learning curve (degree {})".format(degree))
+    plt.xlabel("Number of datapoints")
+    plt.ylabel("MSE")
+    plt.yscale('log')
+    plt.show()
+    if save:
+        plt.savefig(join(plots_dir, model+'_learning_curve-n={}-noise={}.pdf'.format(axis_n**2, noise_var)))
+
 
 #%%Exercise 1
             
@@ -191,6 +519,14 @@ ff = FrankeFunction(axis_n = axis_n, noise_var = noise_var, plot=False)
 ff_data = [ff.x,ff.y,ff.z]
 # Plot regression cofficients and their confidence intervals 
 plot_conf_interval(ff_data, noise_var=noise_var ,axis_n=axis_n) 
+# Spread of MSE and R2 over 100 noise realizations, all fitted with one factorization
+np.random.seed(seed=42)
+ff_m = FrankeFunction(axis_n = axis_n, noise_var = noise_var, realizations = 100)
+reg_m = LinearRegression(ff_m.x, ff_m.y, ff_m.z, degree = 5, split=False, model='OLS')
+MSE_m = reg_m.MSE(reg_m.z_data, reg_m.z_model)
+R2_m = reg_m.R2(reg_m.z_data, reg_m.z_model)
+print("MSE over realizations = {} +- {}".format(np.mean(MSE_m), np.std(MSE_m)))
+print("R2 over realizations = {} +- {}".format(np.mean(R2_m), np.std(R2_m)))
 
 
 #%%Exercise 2
@@ -200,6 +536,14 @@ plot_train_test_MSE(ff_data, axis_n = axis_n, noise_var = noise_var, max_degree
 #Plot as function of complexity
 plot_bias_var_bootstrap(ff_data, max_degree=max_degree, bootstrap_nr = 50, axis_n = axis_n, 
                         noise_var = noise_var, save = save)
+#With the number of resamples per degree chosen for 5% standard errors
+plt.figure()
+plot_bias_var_bootstrap(ff_data, max_degree=max_degree, bootstrap_nr = 500, axis_n = axis_n, 
+                        noise_var = noise_var, tol = 0.05)
+#The same decomposition computed exactly, bootstrap estimate dashed on top
+plt.figure()
+plot_bias_var_analytic(ff_data, max_degree=max_degree, noise_var = noise_var, validate = True,
+                       bootstrap_nr = 50, axis_n = axis_n, save = save)
 #Plot as function of complexity and datapoints
 axis_n_v = [10,15,20,25]
 max_degree_v = [7,10,13,15]
@@ -216,6 +560,11 @@ for i, axis_n in enumerate(axis_n_v):
 plt.tight_layout()
 if save:
     plt.savefig(join(plots_dir, 'n_vs_biasvar.pdf'))
+#MSE as a function of datapoints, for fixed complexity (one pass over the data)
+np.random.seed(seed=42)
+ff = FrankeFunction(axis_n = 25, noise_var = 0.05, plot=False)
+ff_data = [ff.x,ff.y,ff.z]
+plot_learning_curve(ff_data, degree=7, axis_n = 25, noise_var = noise_var, save = save)
 
 #%%Exercise 3
 # Make data
@@ -236,44 +585,35 @@ for i, k in enumerate(k_v):
 
 #%%Exercise 4
 #MSE
-n_lamb = 8
-lambs = np.logspace(-5,2,n_lamb)
+lambs = np.logspace(-5,2,8)
 plt.figure(figsize=(12,6))
-for i in range(n_lamb):
-    plt.subplot(2,4,i+1)
-    plot_train_test_MSE(ff_data,model='Ridge',lamb=lambs[i],max_degree=10)
-    plt.title('$\lambda$='+str(lambs[i]))
-    plt.ylim(0,0.1)
-plt.tight_layout()
+# every degree fitted once for all lambdas
+plot_ridge_lambdas(ff_data, lambs, method='MSE', max_degree=10, ylim=(0,0.1))
 if save:
     plt.savefig(join(plots_dir,'Ridge_MSE'+'-n='+str(axis_n**2)+'-noise='+str(noise_var)+'.pdf'))
 
 #Bootstrap
-n_lamb = 8
-lambs = np.logspace(-5,2,n_lamb)
 plt.figure(figsize=(12,6))
-for i in range(n_lamb):
-    plt.subplot(2,4,i+1)
-    plot_bias_var_bootstrap(ff_data,model='Ridge',lamb=lambs[i],max_degree=10)
-    plt.title('$\lambda$='+str(lambs[i]))
-    plt.ylim(0,0.1)
-plt.tight_layout()
+plot_ridge_lambdas(ff_data, lambs, method='bootstrap', max_degree=10, ylim=(0,0.1))
 if save:
     plt.savefig(join(plots_dir,'Ridge_bootstrap'+'-n='+str(axis_n**2)+'-noise='+str(noise_var)+'.pdf'))
 
 #K-folds
-n_lamb = 8
-lambs = np.logspace(-5,2,n_lamb)
 plt.figure(figsize=(12,6))
-for i in range(n_lamb):
-    plt.subplot(2,4,i+1)
-    plot_mse_kfolds(ff_data,model='Ridge',lamb=lambs[i],max_degree=10)
-    plt.title('$\lambda$='+str(lambs[i]))
-    plt.ylim(0,0.1)
-plt.tight_layout()
+plot_ridge_lambdas(ff_data, lambs, method='kfolds', max_degree=10, ylim=(0,0.1))
 if save:
     plt.savefig(join(plots_dir,'Ridge_kfolds'+'-n='+str(axis_n**2)+'-noise='+str(noise_var)+'.pdf'))
 
+#MSE as function of lambda, all lambdas from one SVD
+plt.figure()
+plot_mse_lambda(ff_data, np.logspace(-5,2,100), degree=5, axis_n = axis_n, 
+                noise_var = noise_var, save = save)
+#LOOCV and GCV in closed form, for model selection without resampling
+plt.figure()
+best_lamb = plot_cv_lambda(ff_data, np.logspace(-10,2,1000), degree=5, axis_n = axis_n, 
+                           noise_var = noise_var, save = save)
+print("Best lambda (LOOCV) = {}".format(best_lamb))
+
 #%%Exercise 5
 #Lasso
 #MSE
@@ -315,6 +655,16 @@ plt.tight_layout()
 if save:
     plt.savefig(join(plots_dir,'Lasso_kfolds'+'-n='+str(axis_n**2)+'-noise='+str(noise_var)+'.pdf'))
 
+#MSE as function of lambda, the whole Lasso path in one call
+plt.figure()
+plot_mse_lambda(ff_data, np.logspace(-7,0,50), model='Lasso', degree=5, axis_n = axis_n, 
+                noise_var = noise_var, save = save)
+
+#%%
+#Random Fourier features vs polynomials, MSE against cost
+plt.figure()
+plot_mse_cost(ff_data, axis_n = axis_n, noise_var = noise_var, save = save)
+
 #%%Exercise 6
 from imageio import imread
 # Load the terrain
@@ -334,52 +684,109 @@ y = np.linspace(0,1,len(terrain.T))
 x_grid, y_grid = np.meshgrid(x,y)
 terrain_data = [x_grid.flatten(),y_grid.flatten(),terrain.flatten()]
 
-reg = LinearRegression(terrain_data[0], terrain_data[1], terrain_data[2], degree = 10, 
+reg = LinearRegression(terrain_data[0], terrain_data[1], terrain_data[2], degree = 10,
                        split=False, model='OLS',lamb=0)
 
+#%%
+#Model of the whole tile at full resolution. The raster is a regular grid, so
+#grid=True fits all pixels without a design matrix and predict_grid evaluates
+#the model the same way
+rows, cols = terrain1.shape
+x_full = np.linspace(0,1,cols)
+y_full = np.linspace(0,1,rows)
+reg_full = LinearRegression(x_full, y_full, terrain1.astype(float), degree = 30,
+                            model='OLS', basis='legendre', grid=True)
+terrain_model = reg_full.z_model
+fig, axs = plt.subplots(1,2)
+axs[0].imshow(terrain1, cmap='gray')
+axs[0].set_title('Terrain over Norway 1')
+axs[1].imshow(terrain_model, cmap='gray')
+axs[1].set_title('OLS, degree 30')
+plt.show()
+
+#%%
+#Train/test scores on the whole tile. fit_stream and score_stream read the raster
+#in blocks of rows, so memory is bounded by the block size
+from terrain import terrain_blocks
+reg_stream = LinearRegression(None, None, None, degree = 10, model=None, 
+                              basis='legendre', domain=((0, 1), (0, 1)))
+reg_stream.fit_stream(terrain_blocks(terrain1), model='OLS', test_size=0.3)
+MSE_train, R2_train, MSE_test, R2_test = reg_stream.score_stream(terrain_blocks(terrain1),
+                                                                 test_size=0.3)
+print("Train MSE = {}, R2 = {}".format(MSE_train, R2_train))
+print("Test MSE = {}, R2 = {}".format(MSE_test, R2_test))
+
+#%%
+#Piecewise model of the whole tile: overlapping 256x256 tiles, each with its own
+#degree, fitted in parallel and blended at the seams
+from terrain import fit_tiles
+terrain_tiles, tile_mse, tile_degree = fit_tiles(terrain1, tile_size=256, overlap=32,
+                                                 degrees=range(2,16))
+print("MSE of the blended model = {}".format(np.mean((terrain_tiles - terrain1)**2)))
+fig, axs = plt.subplots(1,3)
+axs[0].imshow(terrain_tiles, cmap='gray')
+axs[0].set_title('Tiled model')
+im = axs[1].imshow(tile_mse)
+axs[1].set_title('MSE per tile')
+fig.colorbar(im, ax=axs[1])
+im = axs[2].imshow(tile_degree)
+axs[2].set_title('Degree per tile')
+fig.colorbar(im, ax=axs[2])
+plt.show()
+
+#%%
+#Coarse-to-fine model: a global polynomial on the 16x downsampled tile, then tiled
+#residual fits at 4x and full resolution. Error against CPU time per level, with
+#global polynomials of increasing degree for comparison
+from terrain import fit_multires
+terrain_multires, report = fit_multires(terrain1)
+cost_global, MSE_global = [], []
+for deg in [10, 20, 30, 40, 50]:
+    start = time.process_time()
+    reg_deg = LinearRegression(x_full, y_full, terrain1.astype(float), degree = deg,
+                               model='OLS', basis='legendre', grid=True)
+    cost_global.append(time.process_time() - start)
+    MSE_global.append(np.mean((reg_deg.z_model - terrain1)**2))
+for factor, deg, tile_size, MSE_level, cost in report:
+    print("factor {}, degree {}, tiles {}: MSE = {}, CPU time = {}".format(
+        factor, deg, tile_size, MSE_level, cost))
+plt.figure()
+plt.loglog([r[4] for r in report], [r[3] for r in report], 'bo-')
+plt.loglog(cost_global, MSE_global, 'rs-')
+plt.legend(["Coarse-to-fine (per level)", "Global polynomial (degree 10-50)"])
+plt.xlabel("CPU time [s]")
+plt.ylabel("MSE")
+plt.show()
+
 #%%
 #Terrain data OLS
 plt.figure()
-plot_train_test_MSE(terrain_data,max_degree=50)
+plot_train_test_MSE(terrain_data,max_degree=50,adaptive=True,stride=4)
 # plot_conf_interval(terrain_data)
-plot_bias_var_bootstrap(terrain_data,max_degree=25)
+plot_bias_var_bootstrap(terrain_data,max_degree=25,adaptive=True)
 plot_mse_kfolds(terrain_data,max_degree=25)
+#Sparse high degree model: greedy selection over the degree 50 columns
+plt.figure()
+terms = plot_omp_path(terrain_data, degree=50)
+print("OMP keeps {} of {} terms".format(len(terms), 51*52//2))
 #%%    
 #Terrain data Ridge
-n_lamb = 8
-lambs = np.logspace(-5,2,n_lamb)
+lambs = np.logspace(-5,2,8)
 plt.figure(figsize=(12,6))
-for i in range(n_lamb):
-    plt.subplot(2,4,i+1)
-    plot_train_test_MSE(terrain_data,model='Ridge',lamb=lambs[i],max_degree=25)
-    plt.title('$\lambda$='+str(lambs[i]))
-plt.tight_layout()
+# every degree fitted once for all lambdas
+plot_ridge_lambdas(terrain_data, lambs, method='MSE', max_degree=25)
 if save:
     plt.savefig(join(plots_dir,'Ridge_MSE_data'+'-n='+str(axis_n**2)+'-noise='+str(noise_var)+'.pdf'))
 
 
 #Bootstrap
-n_lamb = 8
-lambs = np.logspace(-5,2,n_lamb)
 plt.figure(figsize=(12,6))
-for i in range(n_lamb):
-    plt.subplot(2,4,i+1)
-    plot_bias_var_bootstrap(terrain_data,model='Ridge',lamb=lambs[i],max_degree=25)
-    plt.yscale('log')
-    plt.title('$\lambda$='+str(lambs[i]))
-plt.tight_layout()
+plot_ridge_lambdas(terrain_data, lambs, method='bootstrap', max_degree=25, log=True)
 if save:
     plt.savefig(join(plots_dir,'Ridge_bootstrap_data'+'-n='+str(axis_n**2)+'-noise='+str(noise_var)+'.pdf'))
 
-n_lamb = 8
-lambs = np.logspace(-5,2,n_lamb)
 plt.figure(figsize=(12,6))
-for i in range(n_lamb):
-    plt.subplot(2,4,i+1)
-    plot_mse_kfolds(terrain_data,model='Ridge',lamb=lambs[i],max_degree=25)
-    plt.yscale('log')
-    plt.title('$\lambda$='+str(lambs[i]))
-plt.tight_layout()
+plot_ridge_lambdas(terrain_data, lambs, method='kfolds', max_degree=25, log=True)
 if save:
     plt.savefig(join(plots_dir,'Ridge_kfolds_data'+'-n='+str(axis_n**2)+'-noise='+str(noise_var)+'.pdf'))
 
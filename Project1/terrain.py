@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers for regression on terrain rasters that are too large for one 
+design matrix.
+"""
+import numpy as np
+import scipy.sparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from analysis import LinearRegression
+
+
+def terrain_blocks(terrain, block_rows=32):
+    '''
+    Reads a terrain raster in blocks of rows, for LinearRegression.fit_stream 
+    and score_stream. The coordinates are those of plot.py, x = column and 
+    y = row both scaled to [0, 1]. terrain can be anything that supports row 
+    slicing, e.g. an array from np.load(..., mmap_mode='r'), so only one 
+    block is read into memory at a time.
+    Args:
+        terrain (2d array): raster of heights
+        block_rows (int): number of raster rows per block
+    Yields: 
+        x (1d array): x-coordinates of the block
+        y (1d array): y-coordinates of the block
+        z (1d array): heights of the block
+    '''
+    rows, cols = terrain.shape
+    x_axis = np.linspace(0, 1, cols)
+    y_axis = np.linspace(0, 1, rows)
+    for start in range(0, rows, block_rows):
+        z = np.asarray(terrain[start:start+block_rows], dtype=float)
+        x_2d, y_2d = np.meshgrid(x_axis, y_axis[start:start+len(z)])
+        yield x_2d.ravel(), y_2d.ravel(), z.ravel()
+
+
+def fit_tiles(terrain, tile_size=256, overlap=32, degrees=(5,), model='OLS', 
+              lamb=0, basis='legendre', n_workers=None):
+    '''
+    Piecewise regression of a terrain raster. The raster is cut into 
+    overlapping square tiles and every tile is fitted with its own 
+    polynomial (LinearRegression with grid=True) in a process pool. With 
+    several candidate degrees, each tile picks the one with the lowest MSE 
+    on its odd rows when fitted on its even rows, then is refitted on all 
+    its rows. The tile models are blended with partition-of-unity weights: 
+    each tile weight tapers as sin^2 over the overlap, and the weights are 
+    divided by their sum at every pixel, so the seams are smooth and the 
+    weights add up to one.
+    On Windows the call must be under if __name__ == '__main__'.
+    Args:
+        terrain (2d array): raster of heights
+        tile_size (int): side of a tile in pixels
+        overlap (int): number of pixels shared by neighbouring tiles
+        degrees (list[int]): candidate polynomial degrees for each tile
+        model (str): 'OLS' or 'Ridge'
+        lamb (float): lambda value for Ridge
+        basis (str): polynomial basis, see LinearRegression
+        n_workers (int): number of processes, defaults to the number of 
+            CPUs. 1 fits the tiles in this process.
+    Returns: 
+        z_model (2d array): blended model of the raster
+        tile_mse (2d array): MSE of the model of each tile on that tile
+        tile_degree (2d array): degree used for each tile
+    '''
+    terrain = np.asarray(terrain, dtype=float)
+    rows, cols = terrain.shape
+    row_starts = _tile_starts(rows, tile_size, overlap)
+    col_starts = _tile_starts(cols, tile_size, overlap)
+    x_axis = np.linspace(0, 1, cols)
+    y_axis = np.linspace(0, 1, rows)
+    
+    tasks = []
+    for r in row_starts:
+        for c in col_starts:
+            tasks.append((x_axis[c:c+tile_size], y_axis[r:r+tile_size], 
+                          terrain[r:r+tile_size, c:c+tile_size], 
+                          degrees, model, lamb, basis))
+    if n_workers == 1:
+        results = list(map(_fit_tile, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            results = list(pool.map(_fit_tile, tasks))
+    
+    z_model = np.zeros((rows, cols))
+    weight_sum = np.zeros((rows, cols))
+    tile_mse = np.zeros((len(row_starts), len(col_starts)))
+    tile_degree = np.zeros((len(row_starts), len(col_starts)), dtype=int)
+    for k, (z_tile, mse, degree) in enumerate(results):
+        i, j = divmod(k, len(col_starts))
+        r, c = row_starts[i], col_starts[j]
+        w = np.outer(_tile_weights(r, z_tile.shape[0], rows, overlap), 
+                     _tile_weights(c, z_tile.shape[1], cols, overlap))
+        z_model[r:r+tile_size, c:c+tile_size] += w*z_tile
+        weight_sum[r:r+tile_size, c:c+tile_size] += w
+        tile_mse[i, j], tile_degree[i, j] = mse, degree
+    return z_model/weight_sum, tile_mse, tile_degree
+
+
+def _fit_tile(task):
+    '''
+    Fit one tile for fit_tiles(). Top level so that it can be sent to a 
+    worker process.
+    '''
+    x_axis, y_axis, z_tile, degrees, model, lamb, basis = task
+    degree = degrees[0]
+    if len(degrees) > 1 and len(y_axis) > 1:
+        val_mse = []
+        for deg in degrees:
+            reg = LinearRegression(x_axis, y_axis[::2], z_tile[::2], degree = deg, 
+                                   model = model, lamb = lamb, basis = basis, grid = True)
+            z_val = reg.predict_grid(x_axis, y_axis[1::2])
+            val_mse.append(np.mean((z_tile[1::2] - z_val)**2))
+        degree = degrees[int(np.argmin(val_mse))]
+    reg = LinearRegression(x_axis, y_axis, z_tile, degree = degree, model = model, 
+                           lamb = lamb, basis = basis, grid = True)
+    return reg.z_model, np.mean((z_tile - reg.z_model)**2), degree
+
+
+def _tile_starts(n, tile_size, overlap):
+    '''
+    First pixel of each tile along an axis of n pixels. The last tile is 
+    moved back so that it ends at the edge.
+    '''
+    starts = list(range(0, max(n - tile_size, 0) +1, tile_size - overlap))
+    if starts[-1] + tile_size < n:
+        starts.append(n - tile_size)
+    return starts
+
+
+def _tile_weights(start, length, n, overlap):
+    '''
+    1d blending weight of a tile: 1 inside, rising as sin^2 over the first 
+    overlap pixels and falling over the last ones, except at the edges of 
+    the raster.
+    '''
+    w = np.ones(length)
+    ramp = np.sin(np.pi/2*(np.arange(overlap) + 0.5)/overlap)**2
+    if start > 0: 
+        w[:overlap] = ramp
+    if start + length < n: 
+        w[length-overlap:] = ramp[::-1]
+    return w
+
+
+def fit_multires(terrain, levels=((16, 10, None), (4, 8, 64), (1, 6, 32)), 
+                 model='OLS', lamb=0, basis='legendre', n_workers=1):
+    '''
+    Coarse-to-fine regression of a terrain raster. Every level fits what the 
+    levels before it left over: the residual (terrain minus the current 
+    model) is downsampled by block means, fitted, and the fit is added to the 
+    model at full resolution. A level is either one global polynomial 
+    (evaluated on the full grid with predict_grid) or a tiled model from 
+    fit_tiles() (brought to full resolution by bilinear interpolation). Cheap 
+    coarse levels take the large scale shape, so the fine levels only need 
+    low degrees on small tiles.
+    Args:
+        terrain (2d array): raster of heights
+        levels (list[tuple]): (factor, degree, tile_size) of every level, 
+            coarse to fine. factor is the downsampling factor of the level, 
+            tile_size None fits one polynomial to the whole level
+        model (str): 'OLS' or 'Ridge'
+        lamb (float): lambda value for Ridge
+        basis (str): polynomial basis, see LinearRegression
+        n_workers (int): number of processes of the tiled levels. The 
+            report counts the CPU time of this process only, so it is exact 
+            for n_workers=1.
+    Returns: 
+        z_model (2d array): model of the raster after the last level
+        report (list[tuple]): (factor, degree, tile_size, MSE, CPU seconds) 
+            after every level, MSE on the full raster and CPU seconds summed 
+            over the levels so far
+    '''
+    terrain = np.asarray(terrain, dtype=float)
+    rows, cols = terrain.shape
+    x_axis = np.linspace(0, 1, cols)
+    y_axis = np.linspace(0, 1, rows)
+    z_model = np.zeros((rows, cols))
+    report = []
+    cpu_time = 0
+    for factor, degree, tile_size in levels:
+        start = time.process_time()
+        residual, x_coarse, y_coarse = _downsample(terrain - z_model, x_axis, 
+                                                   y_axis, factor)
+        if tile_size is None:
+            reg = LinearRegression(x_coarse, y_coarse, residual, degree = degree, 
+                                   model = model, lamb = lamb, basis = basis, grid = True)
+            z_model += reg.predict_grid(x_axis, y_axis)
+        else:
+            tiles, _, _ = fit_tiles(residual, tile_size = tile_size, 
+                                    overlap = max(tile_size//8, 1), degrees = (degree,), 
+                                    model = model, lamb = lamb, basis = basis, 
+                                    n_workers = n_workers)
+            z_model += _interp_matrix(y_coarse, y_axis) @ tiles @ \
+                       _interp_matrix(x_coarse, x_axis).T
+        cpu_time += time.process_time() - start
+        report.append((factor, degree, tile_size, 
+                       np.mean((terrain - z_model)**2), cpu_time))
+    return z_model, report
+
+
+def _downsample(z, x_axis, y_axis, factor):
+    '''
+    Block means of factor x factor pixels (smaller blocks at the far edges), 
+    and the coordinates of the block centres.
+    '''
+    if factor == 1:
+        return z, x_axis, y_axis
+    row_starts = np.arange(0, len(y_axis), factor)
+    col_starts = np.arange(0, len(x_axis), factor)
+    row_counts = np.diff(np.append(row_starts, len(y_axis)))
+    col_counts = np.diff(np.append(col_starts, len(x_axis)))
+    z = np.add.reduceat(np.add.reduceat(z, row_starts, axis=0), col_starts, axis=1)
+    z /= np.outer(row_counts, col_counts)
+    x_coarse = np.add.reduceat(x_axis, col_starts)/col_counts
+    y_coarse = np.add.reduceat(y_axis, row_starts)/row_counts
+    return z, x_coarse, y_coarse
+
+
+def _interp_matrix(coarse, fine):
+    '''
+    Sparse matrix of linear interpolation from the points coarse to the 
+    points fine (constant beyond the ends), so that a coarse raster is 
+    brought to full resolution as W_y @ z_coarse @ W_x^T.
+    '''
+    if len(coarse) == len(fine):
+        return scipy.sparse.identity(len(fine), format='csr')
+    right = np.clip(np.searchsorted(coarse, fine), 1, len(coarse) -1)
+    left = right - 1
+    t = np.clip((fine - coarse[left])/(coarse[right] - coarse[left]), 0, 1)
+    rows = np.arange(len(fine))
+    return scipy.sparse.csr_matrix(
+        (np.concatenate([1 - t, t]), (np.concatenate([rows, rows]), 
+                                      np.concatenate([left, right]))),
+        shape=(len(fine), len(coarse)))